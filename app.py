@@ -1,37 +1,41 @@
 # Main application entry point
 
+import json
+import threading
+import time
 from collections import defaultdict
-from statistics import mean
 from typing import List
-from flask import Flask, render_template, request, abort, redirect, url_for
-
-# Importing api clients, when have acess to API would be real
-from trend.api_clients.grailed_client import GrailedClient
-from trend.api_clients.mercari_us_client import MercariUSClient
-from trend.api_clients.depop_client_fake import DepopClientFake
-from trend.api_clients.poshmark_client_fake import PoshmarkClientFake
-from trend.api_clients.facebook_marketplace_client_fake import FacebookMarketplaceClientFake
-from trend.db import init_db
+from flask import Flask, Response, before_render_template, g, render_template, request, abort, redirect, stream_with_context, template_rendered, url_for
+
+# api clients come from the registry, each one is imported/built the first time its site is searched
+from trend.api_clients import Clients, site_info, sites
+from trend.api_clients.guard import guard_stats
+from trend.filters import compile_filter
+from trend.history import price_history, weekly_change
+from trend.ingest import ingest_queue
+from trend import metrics
+from trend.metrics import REQUEST_SECONDS, TEMPLATE_SECONDS, timed
 from trend.models import Listing
+from trend.percolator import RulePercolator
+from trend.planner import plan_pushdown, predicates, rule_predicates
+from trend.cache import normalize_query, search_cache
+from trend.dedupe import duplicate_index
+from trend.rules import rule_store
+from trend.search import fan_out, iter_fan_out
+from trend.seen import seen_index
+from trend.rule_state import rule_state_store
+from trend.watcher import RuleScheduler
 
 
 # (checks if exists)
-from trend.price_stats import average_price_for_query
+from trend.price_stats import average_price_for_query, daily_prices, weekly_price_change
 
-print(">>> importing app.py")
 app = Flask(__name__)
 
-# Initialize DB and clients
-init_db()
-grailed_client = GrailedClient()
-mercari_us_client = MercariUSClient()
-depop_client = DepopClientFake()
-poshmark_client = PoshmarkClientFake()
-facebook_client = FacebookMarketplaceClientFake()
+# nothing is set up at import: tables are created on the first DB connection, clients on first use
+site_clients = Clients()
 
 
-watch_rules: list[dict] = []
-_next_watch_id = 1
 
 # Fake user will want to add real profile section later
 current_user = {"username": "demo_user","email": "demo@trendtracker.app","plan": "Beta access",}
@@ -48,118 +52,215 @@ def normalize_url(site: str, url: str | None) -> str | None:
     if url.startswith("http"):
         return url
 
-    site_domains = {
-        "grailed": "https://www.grailed.com","depop": "https://www.depop.com",
-        "poshmark": "https://poshmark.com",
-        "mercari_us": "https://www.mercari.com",
-        "facebook_marketplace": "https://www.facebook.com",
-    }
-    base = site_domains.get(site, "")
+    info = site_info(site)
+    base = info.domain if info else ""
     return base + url
 
 
-def run_search(query: str, selected_sites: List[str], limit: int = 20) -> List[Listing]:
+def run_search(query: str, selected_sites: List[str], limit: int = 20, keep=None, pushdown=None) -> List[Listing]:
     """
     Aggregate s results from all selected marketplaces.
+    Sites are searched in parallel, the returned list has .timed_out/.failed for sites that didn't make it.
+    keep: optional filter, sites then page until `limit` listings pass it (only those are returned)
+    pushdown: (sites, predicates) of every rule/search that shares this fetch, sites that can
+    filter on those themselves get them passed to search()
     """
-    all_results: List[Listing] = []
-
     # Check which sites the user wants to search
-    if "grailed" in selected_sites:
-        all_results.extend(grailed_client.search(query, limit=limit))
-    if "mercari_us" in selected_sites:
-        all_results.extend(mercari_us_client.search(query, limit=limit))
-    if "depop" in selected_sites:
-        all_results.extend(depop_client.search(query, limit=limit))
-    if "poshmark" in selected_sites:
-        all_results.extend(poshmark_client.search(query, limit=limit))
-    if "facebook_marketplace" in selected_sites:
-        all_results.extend(facebook_client.search(query, limit=limit))
+    clients = site_clients.pick(selected_sites)
+    filters = plan_pushdown(list(clients), pushdown) if pushdown else None
+    all_results = fan_out(clients, query, limit=limit, keep=keep, filters=filters)
+    return finish_results(all_results, query)
+
 
+def finish_results(listings, query: str):
     # Fix up URlls before returning
-    for r in all_results:
+    for r in listings:
         r.url = normalize_url(r.site, getattr(r, "url", None))
-    return all_results
 
+    # keep everything we fetched for the historical price stats (written in the background)
+    ingest_queue.put(listings, query=query)
+    return listings
 
+
+@timed("apply_filters")
 def apply_filters(listings, tags=None, max_price=None):
     """
     Filters raw results based on user criteria.
     - tags: simple keyword matching (OR logic)
     - max_price: strict upper bound
+    The filter is compiled once per (tags, max_price) and reused, see trend/filters.py
     """
     if not listings:
         return []
 
-    
-    tags = [t.lower().strip() for t in (tags or []) if t.strip()]
-    filtered = []
-
-    for l in listings:
-        # Combination of text for streamlined search
-        parts = [getattr(l, "title", "") or "",getattr(l, "brand", "") or "",getattr(l, "size", "") or "",]
-        text_raw = " ".join(parts).lower()
+    return compile_filter(tuple(tags or ()), max_price)(listings)
 
-        # Normalize text to handle issiues
-        text = "".join(ch for ch in text_raw if ch.isalnum() or ch.isspace())
-        text_no_space = text.replace(" ", "")
 
-        
-        if tags:
-            match_any = False
-            for tag in tags:
-                t = "".join(ch for ch in tag.lower() if ch.isalnum())
-                if not t:
-                    continue
-                
-                if t in text or t in text_no_space:
-                    match_any = True
-                    break
-            if not match_any:
-                continue
-
-       
-        if max_price is not None and (l.price is None or l.price > max_price):
-            continue
-        filtered.append(l)
+@timed("compute_stats")
+def compute_stats(listings):
+    """
+    Calculates basic stats for the dashboard/analytics view.
+    Takes a list of listings or an already built ListingBatch (numpy columns).
+    """
+    # numpy is only imported once stats are actually needed, keeps app import fast
+    from trend import columns
 
-    return filtered
+    batch = listings if isinstance(listings, columns.ListingBatch) else columns.ListingBatch(listings)
+    return columns.compute_stats(batch)
 
 
-def compute_stats(listings: List[Listing]):
+def get_matches_for_rules(rules: list[dict]) -> dict[int, list[Listing]]:
     """
-    Calculates basic stats for the dashboard/analytics view.
+    Runs saved rules together: each distinct (query, site) is fetched once
+    and every rule filters the shared results with its own tags/max price.
     """
-    if not listings:
-        return {"total": 0,"by_site": {},"avg_price_overall": None,"avg_price_by_site": {},"cheapest": None,}
+    by_query = {}
+    for rule in rules:
+        q = by_query.setdefault(normalize_query(rule["query"]), {"query": rule["query"], "sites": set(), "rules": []})
+        q["sites"].update(rule["sites"])
+        q["rules"].append(rule)
+
+    fetched = []  # (query key, listing)
+    for key, q in by_query.items():
+        # a query only one rule uses can page deeper and stop once 100 listings pass that rule's filter
+        keep = None
+        only = q["rules"][0] if len(q["rules"]) == 1 else None
+        if only and (only["tags"] or only["max_price"] is not None):
+            keep = compile_filter(tuple(only["tags"]), only["max_price"]).matches
+        # price bounds etc. the sites can apply themselves are sent upstream, tags stay local
+        wanted = [(rule["sites"], rule_predicates(rule)) for rule in q["rules"]]
+        fetched.extend((key, l) for l in run_search(q["query"], list(q["sites"]), limit=100, keep=keep, pushdown=wanted))
+
+    # every listing is looked up once in an index of the rules instead of filtering per rule
+    found = RulePercolator(rules).match_many(fetched)
+    # the same item cross-posted on several sites is one match (the cheapest post)
+    return {rule["id"]: duplicate_index.dedupe(found.get(rule["id"], [])) for rule in rules}
 
-    by_site_counts = defaultdict(int)
-    by_site_prices = defaultdict(list)
 
-    for l in listings:
-        by_site_counts[l.site] += 1
-        if l.price and l.price > 0:
-            by_site_prices[l.site].append(l.price)
+def get_rule_matches(rule: dict) -> list[Listing]:
+    #running saved rule
+    return get_matches_for_rules([rule])[rule["id"]]
 
-    
-    by_site_avg = {site: round(mean(prices), 2) for site, prices in by_site_prices.items() if prices}
 
-    valid = [l for l in listings if l.price is not None]
-    cheapest = min(valid, key=lambda x: x.price) if valid else None
+# rules are re-checked in the background, pages read the latest result
+# state lives in SQLite and only one worker process (the lease holder) runs the rules
+rule_scheduler = RuleScheduler(rule_store.all, get_matches_for_rules, seen_index, rule_state_store)
 
-    all_prices = [l.price for l in valid if l.price and l.price > 0]
-    avg_overall = round(mean(all_prices), 2) if all_prices else None
+# every listing any search brings in is matched against all rules, so rules pick up
+# new items from other searches between their own runs
+rule_percolator = RulePercolator(snapshot=rule_store.snapshot)
+
+
+def cluster_ingested(items):
+    # stored listings get their duplicate cluster, before percolating so new-ness sees it
+    duplicate_index.add([l for _, l in items])
+
+
+def record_prices(items):
+    # a price observation per item when it's new or its price moved (uses the clusters above)
+    price_history.record([l for _, l in items])
+
+
+def percolate_ingested(items):
+    rule_percolator.refresh()
+    rule_scheduler.offer(rule_percolator.match_many(items))
+
+
+ingest_queue.subscribe(cluster_ingested)
+ingest_queue.subscribe(record_prices)
+ingest_queue.subscribe(percolate_ingested)
+
+
+def current_matches(rule: dict) -> list[Listing]:
+    # latest background result, or evaluate now if the rule hasn't run yet
+    st = rule_scheduler.state(rule["id"])
+    if st is None or st["updated_at"] is None:
+        st = rule_scheduler.run_now(rule)
+    return st["matches"]
+
+
+@app.before_request
+def start_background_jobs():
+    rule_scheduler.start()
+
+
+# --- timing for /metrics ---
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_time(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint, request.method, response.status_code)
+    return response
+
+
+# templates can render inside each other, so starts are kept as a per-thread stack
+_render_starts = threading.local()
+
+
+def _template_started(sender, template, context, **extra):
+    _render_starts.__dict__.setdefault("stack", []).append(time.perf_counter())
+
+
+def _template_done(sender, template, context, **extra):
+    stack = getattr(_render_starts, "stack", None)
+    if stack:
+        TEMPLATE_SECONDS.observe(time.perf_counter() - stack.pop(), template.name)
+
+
+before_render_template.connect(_template_started, app)
+template_rendered.connect(_template_done, app)
+
+# read when /metrics is scraped
+metrics.gauge_callback("trend_search_cache", "Search cache counters and size.", lambda: {(k,): v for k, v in search_cache.stats().items()}, ("stat",))
+metrics.gauge_callback("trend_ingest", "Listing ingest queue counters.", lambda: {(k,): v for k, v in ingest_queue.stats().items()}, ("stat",))
+metrics.gauge_callback("trend_site_circuit_open", "1 while a site's circuit breaker isn't closed.", lambda: {(site,): int(s["state"] != "closed") for site, s in guard_stats().items()}, ("site",))
+metrics.gauge_callback("trend_watch_rules", "Saved watch rules.", lambda: {(): rule_store.count()})
 
-    return {"total": len(listings),"by_site": dict(by_site_counts),"avg_price_overall": avg_overall,"avg_price_by_site": by_site_avg,"cheapest": cheapest,}
 
 
-def get_rule_matches(rule: dict) -> list[Listing]:
-    #running saved rule
-    raw = run_search(rule["query"], rule["sites"], limit=100)
-    return apply_filters(raw, tags=rule["tags"], max_price=rule["max_price"])
 
+ALL_SITES = sites()
 
 
+def site_choices() -> list:
+    # (value, label) pairs for the site checkboxes
+    return [(s, site_info(s).label) for s in sites()]
+
+
+@app.context_processor
+def inject_site_labels():
+    # every template can show a site's label from the registry (site_labels[site])
+    return {"site_labels": {s: site_info(s).label for s in sites()}}
+
+
+def read_search_form(form) -> dict:
+    """Search box values from request.form / request.args."""
+    tags_input = form.get("tags", "").strip()
+    max_price_input = form.get("max_price", "").strip()
+
+    max_price = None
+    if max_price_input:
+        try:
+            max_price = float(max_price_input)
+        except ValueError:
+            max_price = None
+
+    return {
+        "query": form.get("query", "").strip(),
+        "tags_input": tags_input,
+        "max_price_input": max_price_input,
+        "selected_sites": form.getlist("sites") or ALL_SITES,
+        "tags": [t.strip() for t in tags_input.split(",") if t.strip()],
+        "max_price": max_price,
+    }
+
 
 @app.route("/", methods=["GET", "POST"])
 def index():
@@ -167,30 +268,24 @@ def index():
     query = ""
     tags_input = ""
     max_price_input = ""
-    selected_sites = ["grailed", "mercari_us", "depop", "poshmark", "facebook_marketplace"]
+    selected_sites = ALL_SITES
     results: List[Listing] = []
     stats = None
+    missing_sites = []
 
     if request.method == "POST":
-        
-        query = request.form.get("query", "").strip()
-        tags_input = request.form.get("tags", "").strip()
-        max_price_input = request.form.get("max_price", "").strip()
-        selected_sites = request.form.getlist("sites") or selected_sites
-        tags = [t.strip() for t in tags_input.split(",") if t.strip()]
-
-        max_price = None
-        if max_price_input:
-            try:
-                max_price = float(max_price_input)
-            except ValueError:
-                
-                max_price = None
+        form = read_search_form(request.form)
+        query, tags_input, max_price_input = form["query"], form["tags_input"], form["max_price_input"]
+        selected_sites = form["selected_sites"]
 
         if query and selected_sites:
             
-            raw_results = run_search(query, selected_sites, limit=50)
-            results = apply_filters(raw_results, tags=tags, max_price=max_price)
+            wanted = [(selected_sites, predicates(max_price=form["max_price"]))]
+            raw_results = run_search(query, selected_sites, limit=50, pushdown=wanted)
+            missing_sites = raw_results.missing_sites
+            results = apply_filters(raw_results, tags=form["tags"], max_price=form["max_price"])
+            # cross-posted items show up once
+            results = duplicate_index.dedupe(results)
             stats = compute_stats(results)
 
     # Grouping  results by site for display
@@ -198,12 +293,52 @@ def index():
     for r in results:
         grouped[r.site].append(r)
 
-    return render_template("index.html",query=query,tags_input=tags_input,max_price_input=max_price_input,selected_sites=selected_sites,grouped_results=grouped,stats=stats,)
+    return render_template("index.html",query=query,tags_input=tags_input,max_price_input=max_price_input,selected_sites=selected_sites,all_sites=site_choices(),grouped_results=grouped,stats=stats,missing_sites=missing_sites,)
+
+
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route("/search/stream")
+def search_stream():
+    """
+    Same search as the index form but as Server-Sent Events:
+    a "site" event per marketplace as soon as it answers (its results + running stats as html),
+    then a "done" event with the sites that didn't make it.
+    """
+    form = read_search_form(request.args)
+    if not form["query"]:
+        abort(400)
+    clients = site_clients.pick(form["selected_sites"])
+    filters = plan_pushdown(list(clients), [(form["selected_sites"], predicates(max_price=form["max_price"]))])
+
+    def events():
+        shown = []
+        shown_clusters = set()
+        missing_sites = []
+        for r in iter_fan_out(clients, form["query"], limit=50, filters=filters):
+            if r.listings is None:
+                missing_sites.append(r.site)
+                continue
+            items = apply_filters(finish_results(r.listings, form["query"]), tags=form["tags"], max_price=form["max_price"])
+            # an item already shown from a site that answered earlier isn't repeated
+            items = duplicate_index.dedupe(items, shown=shown_clusters)
+            shown.extend(items)
+            yield sse("site", {
+                "site": r.site,
+                "count": len(items),
+                "html": render_template("_site_results.html", site=r.site, items=items) if items else "",
+                "stats_html": render_template("_stats.html", stats=compute_stats(shown)),
+            })
+        yield sse("done", {"missing_html": render_template("_missing_sites.html", missing_sites=missing_sites)})
+
+    # no-cache + no proxy buffering, otherwise the events arrive all at once
+    return Response(stream_with_context(events()), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @app.route("/watch", methods=["GET", "POST"])
 def watch():
-    global _next_watch_id
     message = None
 
     # New watch rules
@@ -222,8 +357,8 @@ def watch():
                 max_price = None
 
         if query and selected_sites:
-            watch_rules.append({"id": _next_watch_id,"query": query,"tags": tags,"max_price": max_price,"sites": selected_sites,"seen_ids": set(),})
-            _next_watch_id += 1
+            rule = rule_store.add(query, tags, max_price, selected_sites)
+            rule_scheduler.trigger(rule["id"])
             message = "Watch rule added!"
         else:
             message = "Please provide a query and at least one site."
@@ -232,20 +367,18 @@ def watch():
     notifications = []
     rule_summaries = []
 
+    # matches come from the background scheduler, nothing is fetched here
+    watch_rules = rule_store.all()
     for rule in watch_rules:
-        matches = get_rule_matches(rule)
+        st = rule_scheduler.state(rule["id"])
+        matches = st["matches"] if st else []
         summary = compute_stats(matches)
 
-        new_items = []
-        for item in matches:
-            if item.listing_id and item.listing_id not in rule["seen_ids"]:
-                new_items.append(item)
-                rule["seen_ids"].add(item.listing_id)
-
+        new_items = rule_scheduler.take_new_items(rule["id"])
         if new_items:
             notifications.append({"rule": rule, "items": new_items})
 
-        rule_summaries.append({"rule": rule, "summary": summary})
+        rule_summaries.append({"rule": rule, "summary": summary, "pending": st is None or st["updated_at"] is None})
 
     return render_template(
         "watch.html",
@@ -259,11 +392,11 @@ def watch():
 @app.route("/watch/<int:rule_id>")
 def watch_detail(rule_id: int):
    
-    rule = next((r for r in watch_rules if r["id"] == rule_id), None)
+    rule = rule_store.get(rule_id)
     if not rule:
         abort(404)
     
-    matches = get_rule_matches(rule)
+    matches = current_matches(rule)
     stats = compute_stats(matches)
     # Sort by price 
     matches_sorted = sorted(matches,key=lambda x: (x.price if x.price is not None else 1e9))
@@ -272,7 +405,7 @@ def watch_detail(rule_id: int):
 
 @app.route("/watch/<int:rule_id>/edit", methods=["GET", "POST"])
 def watch_edit(rule_id: int):
-    rule = next((r for r in watch_rules if r["id"] == rule_id), None)
+    rule = rule_store.get(rule_id)
     if not rule:
         abort(404)
 
@@ -290,15 +423,16 @@ def watch_edit(rule_id: int):
                 max_price = None
 
         
+        changes = {"tags": tags, "max_price": max_price}
         if query:
-            rule["query"] = query
-        rule["tags"] = tags
-        rule["max_price"] = max_price
+            changes["query"] = query
         if selected_sites:
-            rule["sites"] = selected_sites
+            changes["sites"] = selected_sites
+        rule_store.update(rule_id, **changes)
+        rule_scheduler.invalidate(rule_id)
         return redirect(url_for("watch_detail", rule_id=rule_id))
 
-    all_sites = [("grailed", "Grailed"),("mercari_us", "Mercari US (simulated)"),("depop", "Depop (simulated)"),("poshmark", "Poshmark (simulated)"),("facebook_marketplace", "Facebook Marketplace (simulated)"),]
+    all_sites = site_choices()
     tags_string = ", ".join(rule.get("tags", [])) if rule.get("tags") else ""
 
     return render_template("watch_edit.html",rule=rule,all_sites=all_sites,tags_string=tags_string,)
@@ -307,7 +441,6 @@ def watch_edit(rule_id: int):
 @app.route("/watch_add", methods=["POST"])
 def watch_add():
     # Quick add function
-    global _next_watch_id
     item = request.form.to_dict()
     title = (item.get("title") or "").strip()
     site = (item.get("site") or "").strip()
@@ -321,9 +454,8 @@ def watch_add():
             max_price = None
     sites = [site] if site else []
 
-    rule = {"id": _next_watch_id,"query": title or "Untitled watch","tags": [],"max_price": max_price,"sites": sites,"seen_ids": set(),}
-    watch_rules.append(rule)
-    _next_watch_id += 1
+    rule = rule_store.add(title or "Untitled watch", [], max_price, sites)
+    rule_scheduler.trigger(rule["id"])
     print("Added watch rule from listing:", rule)
     return redirect(url_for("watch_edit", rule_id=rule["id"]))
 
@@ -334,13 +466,16 @@ def analytics():
     New analytics endpoint:
       - One accordion card per watch rule
       - For each rule: stats, lowest price, DB historical avg
-      - Trend data with: line+dots for "main" listing, dots for everything else (BaT style)
+      - Trend data with: a price line per tracked item (from the stored history), dots for everything else (BaT style)
     """
+    from trend.columns import ListingBatch, trend_series
+
     rule_blocks = []   #
-    for rule in watch_rules:
-        # new matches
-        matches = get_rule_matches(rule)
-        stats = compute_stats(matches)
+    for rule in rule_store.all():
+        # new matches, columns are built once and used for stats + trend
+        matches = current_matches(rule)
+        batch = ListingBatch(matches)
+        stats = compute_stats(batch)
 
         # lowest price info
         lowest_listing = stats.get("cheapest")
@@ -354,46 +489,43 @@ def analytics():
             print("average_price_for_query failed:", e)
             historical_avg = None
 
-        
-        dated = [m for m in matches if m.created_at and m.price]
-        
-        dated_sorted = sorted(dated, key=lambda m: m.created_at.isoformat())
-        q_norm = (rule["query"] or "").strip().lower()
-        def is_main_listing(listing):
-            title_norm = (listing.title or "").strip().lower()
-            return title_norm == q_norm
-
-    
-
-        trend_points = []
-        for m in dated_sorted:
-            trend_points.append({"title": m.title,"date": m.created_at.isoformat(),"price": m.price,"site": m.site,"is_main": bool(is_main_listing(m)),})
+        # dated points sorted by date, for the scatter
+        trend_points = trend_series(batch)
 
-       
-        avg_change_per_week = None
-        main_points = [m for m in dated_sorted if is_main_listing(m)]
+        # price lines of the most tracked items among the matches, weekly change of the top one
+        try:
+            item_lines = price_history.item_lines(duplicate_index.keys(matches))
+        except Exception as e:
+            print("item_lines failed:", e)
+            item_lines = []
+        avg_change_per_week = weekly_change(item_lines[0]["points"]) if item_lines else None
 
-        if len(main_points) >= 2:
-            first = main_points[0]
-            last = main_points[-1]
-            days = (last.created_at - first.created_at).days
-            if days != 0:
-                weeks = days / 7.0
-                if weeks > 0:
-                    change = last.price - first.price
-                    avg_change_per_week = round(change / weeks, 2)
+        # price history for this rule's query from the daily rollup
+        try:
+            daily_points = daily_prices(rule["query"])
+        except Exception as e:
+            print("daily_prices failed:", e)
+            daily_points = []
+        if avg_change_per_week is None:
+            avg_change_per_week = weekly_price_change(daily_points)
 
       
       
-        rule_blocks.append({"id": rule["id"],"query": rule["query"],"sites": rule.get("sites", []),"tags": rule.get("tags", []),"stats": stats,"lowest_price": lowest_price,"lowest_currency": lowest_currency,"historical_avg": historical_avg,"avg_change_per_week": avg_change_per_week,"trend_points": trend_points,})
+        rule_blocks.append({"id": rule["id"],"query": rule["query"],"sites": rule.get("sites", []),"tags": rule.get("tags", []),"stats": stats,"lowest_price": lowest_price,"lowest_currency": lowest_currency,"historical_avg": historical_avg,"avg_change_per_week": avg_change_per_week,"trend_points": trend_points,"item_lines": item_lines,"daily_points": daily_points,})
     return render_template("analytics.html", rules=rule_blocks)
 
 
 @app.route("/profile")
 def profile():
-    total_rules = len(watch_rules)
-    total_seen = sum(len(r["seen_ids"]) for r in watch_rules)
-    return render_template("profile.html",user=current_user,total_rules=total_rules,total_seen=total_seen,)
+    total_rules = rule_store.count()
+    total_seen = seen_index.count()
+    return render_template("profile.html",user=current_user,total_rules=total_rules,total_seen=total_seen,cache_stats=search_cache.stats(),ingest_stats=ingest_queue.stats(),site_health=guard_stats(),)
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    # Prometheus text format
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 
 if __name__ == "__main__":
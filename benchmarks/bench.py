@@ -0,0 +1,319 @@
+#Benchmarks for the search -> filter -> stats -> render pipeline, using the fake clients only (no network)
+#
+#   python benchmarks/bench.py                          # default sizes
+#   python benchmarks/bench.py --sizes 1000,1000000 --rules 200 --latency 50 --out bench.json
+#
+# Every result has throughput (listings or requests per second), p50/p99/mean latency in ms
+# and peak traced memory in KB, printed as JSON so two runs can be diffed.
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+FAKE_SITES = ["mercari_us", "depop", "poshmark", "facebook_marketplace"]
+QUERIES = ["jacket", "hoodie", "tee", "bmw", "cargo pants", "puffer", "fleece", "track jacket"]
+TAGS = ["vintage", "nike", "y2k", "carhartt", "oversized", "black", "manual"]
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Benchmarks for search/filter/stats/analytics/db on the fake clients")
+    p.add_argument("--sizes", default="1000,10000,100000", help="listing counts, comma separated")
+    p.add_argument("--rules", type=int, default=50, help="watch rules for the /analytics benchmark")
+    p.add_argument("--latency", type=float, default=0.0, help="simulated per-request site latency in ms")
+    p.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark")
+    p.add_argument("--seed", type=int, default=1234)
+    p.add_argument("--only", default="", help="comma separated benchmark groups: search,filter,stats,analytics,db,dedupe")
+    p.add_argument("--out", help="write the JSON here instead of stdout")
+    return p.parse_args()
+
+
+def quiet():
+    # the fake clients print on every call, that's not what we're timing
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def measure(fn, repeat: int, items: int = 1, setup=None, warmup: bool = True) -> dict:
+    """
+    Time fn() `repeat` times (after one warm up run), then once more under tracemalloc for peak memory.
+    setup() runs before every call and isn't timed. items = work units per call for throughput.
+    """
+    def once():
+        if setup:
+            setup()
+        with quiet():
+            start = time.perf_counter()
+            fn()
+            return time.perf_counter() - start
+
+    if warmup:
+        once()
+    times = sorted(once() for _ in range(repeat))
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    with quiet():
+        fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    mean = statistics.fmean(times)
+    return {
+        "runs": repeat,
+        "items": items,
+        "throughput_per_s": round(items / mean, 1) if mean else None,
+        "p50_ms": round(percentile(times, 50) * 1000, 3),
+        "p99_ms": round(percentile(times, 99) * 1000, 3),
+        "mean_ms": round(mean * 1000, 3),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def percentile(sorted_values, pct: float) -> float:
+    # nearest rank, fine for a handful of runs
+    k = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[k]
+
+
+def with_latency(client, delay: float):
+    """Same client but every upstream page takes `delay` seconds, like a real marketplace."""
+    if not delay:
+        return client
+
+    class Slow(type(client)):
+        def search_page(self, *args, **kwargs):
+            time.sleep(delay)
+            return super().search_page(*args, **kwargs)
+
+    return Slow()
+
+
+def make_listings(clients, n: int, query: str = "jacket"):
+    """n fake listings spread over the fake sites (page_size = what each site needs)."""
+    per_site = -(-n // len(FAKE_SITES))
+    out = []
+    with quiet():
+        for site in FAKE_SITES:
+            client = clients[site]
+            # facebook has a fixed data set, repeat it to fill its share
+            page = client.search_page(query, page=1, page_size=per_site)
+            while page and len(page) < per_site:
+                page = page + page[:per_site - len(page)]
+            out.extend(page)
+    return out[:n]
+
+
+def bench_search(A, sizes, args, results):
+    from trend.cache import search_cache
+
+    for n in sizes:
+        per_site = -(-n // len(FAKE_SITES))
+        query = random.choice(QUERIES)
+        results[f"run_search/cold/{n}"] = measure(
+            lambda: A.run_search(query, FAKE_SITES, limit=per_site), args.repeat, items=n, setup=search_cache.clear
+        )
+        results[f"run_search/cached/{n}"] = measure(
+            lambda: A.run_search(query, FAKE_SITES, limit=per_site), args.repeat, items=n
+        )
+
+
+def bench_filter_stats(A, sizes, args, results, groups):
+    from trend.columns import ListingBatch
+
+    for n in sizes:
+        listings = make_listings(A.site_clients, n)
+        tags = random.sample(TAGS, 3)
+        if "filter" in groups:
+            results[f"apply_filters/{n}"] = measure(
+                lambda: A.apply_filters(listings, tags=tags, max_price=80.0), args.repeat, items=n
+            )
+        if "stats" in groups:
+            results[f"compute_stats/{n}"] = measure(lambda: A.compute_stats(listings), args.repeat, items=n)
+            batch = ListingBatch(listings)
+            results[f"compute_stats/prebuilt_batch/{n}"] = measure(lambda: A.compute_stats(batch), args.repeat, items=n)
+
+
+def bench_analytics(A, args, results):
+    from trend.rules import rule_store
+
+    for i in range(args.rules):
+        rule_store.add(
+            query=random.choice(QUERIES),
+            tags=random.sample(TAGS, random.randint(0, 2)),
+            max_price=random.choice([None, 50.0, 100.0, 25000.0]),
+            sites=random.sample(FAKE_SITES, random.randint(1, len(FAKE_SITES))),
+        )
+    rules = rule_store.all()
+
+    # evaluate every rule up front so the page (and the background scheduler) find fresh results
+    with quiet():
+        for rule in rules:
+            A.rule_scheduler.run_now(rule)
+    A.ingest_queue.flush()
+
+    client = A.app.test_client()
+
+    def get():
+        r = client.get("/analytics")
+        assert r.status_code == 200, r.status_code
+
+    results[f"analytics_route/{len(rules)}_rules"] = measure(get, args.repeat, items=1)
+    A.rule_scheduler.stop()
+
+
+def bench_db(A, sizes, args, results):
+    from trend.ingest import save_listings
+    from trend.price_stats import average_price_for_query, daily_prices
+
+    for n in sizes:
+        query = random.choice(QUERIES)
+        listings = make_listings(A.site_clients, n, query=query)
+        # first write inserts, after that the same ids hit the upsert path
+        results[f"db/save_listings/insert/{n}"] = measure(
+            lambda: save_listings(listings, query=query), 1, items=n, warmup=False
+        )
+        results[f"db/save_listings/upsert/{n}"] = measure(
+            lambda: save_listings(listings, query=query), args.repeat, items=n
+        )
+        results[f"db/average_price_for_query/{n}"] = measure(
+            lambda: average_price_for_query(query), args.repeat
+        )
+        results[f"db/daily_prices/{n}"] = measure(lambda: daily_prices(query), args.repeat)
+
+
+def bench_dedupe(A, sizes, args, results):
+    import dataclasses
+    import itertools
+    import trend.db
+    from trend.dedupe import DuplicateIndex
+
+    # every run gets its own empty DB file, listings the other groups already ingested
+    # (the fake ids repeat) would make add/resolve a lookup of stored rows
+    A.ingest_queue.flush()
+    main_db = trend.db.DB_PATH
+    runs = itertools.count()
+
+    for n in sizes:
+        query = random.choice(QUERIES)
+        listings = [
+            dataclasses.replace(l, listing_id=f"bench-dedupe-{n}-{i}")
+            for i, l in enumerate(make_listings(A.site_clients, n, query=query))
+        ]
+        stored, fresh = listings[:n // 2], listings[n // 2:]
+        state = {}
+
+        def reset(prefill: bool = False, warm: bool = False):
+            trend.db.DB_PATH = main_db.parent / f"dedupe-{next(runs)}.db"
+            state["index"] = DuplicateIndex()
+            if prefill:
+                # warm = the timed index has the stored half in its LRU, otherwise only in the tables
+                (state["index"] if warm else DuplicateIndex()).add(stored)
+
+        results[f"dedupe/add/{n}"] = measure(
+            lambda: state["index"].add(stored), args.repeat, items=len(stored), setup=reset
+        )
+        # listings that aren't stored yet: resolve (request path) only clusters them in memory,
+        # assign compares them against the n/2 stored ones and stores them
+        results[f"dedupe/resolve_fresh/{n}"] = measure(
+            lambda: state["index"].resolve(fresh), args.repeat, items=len(fresh), setup=lambda: reset(prefill=True)
+        )
+        results[f"dedupe/assign_fresh/{n}"] = measure(
+            lambda: state["index"].assign(fresh), args.repeat, items=len(fresh), setup=lambda: reset(prefill=True)
+        )
+        results[f"dedupe/resolve_stored/{n}"] = measure(
+            lambda: state["index"].resolve(stored), args.repeat, items=len(stored), setup=lambda: reset(prefill=True)
+        )
+        results[f"dedupe/resolve_stored_lru/{n}"] = measure(
+            lambda: state["index"].resolve(stored), args.repeat, items=len(stored), setup=lambda: reset(prefill=True, warm=True)
+        )
+    trend.db.DB_PATH = main_db
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def main():
+    args = parse_args()
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    groups = set(filter(None, args.only.split(","))) or {"search", "filter", "stats", "analytics", "db", "dedupe"}
+    # the fake clients use the global random module, so this fixes their data
+    # (sites searched in parallel can still interleave, sizes and shapes stay the same)
+    random.seed(args.seed)
+    out_path = Path(args.out).resolve() if args.out else None
+
+    # everything (db, WAL files) goes to a temp dir, the real marketwatcher.db is left alone
+    workdir = tempfile.mkdtemp(prefix="trend-bench-")
+    os.chdir(workdir)
+    import trend.db
+    trend.db.DB_PATH = Path(workdir) / "bench.db"
+
+    # benchmarks call the sites far faster than the real rate limits allow
+    from trend.api_clients import guard
+    guard.DEFAULT_RATE = (1e9, 10**9)
+    guard.SITE_RATES = {}
+    # and big result sets take longer than the per-site deadlines, we want the full result timed
+    from trend import search
+    search.SITE_TIMEOUTS = {}
+    search.DEFAULT_TIMEOUT = 3600.0
+
+    with quiet():
+        import app as A
+
+    delay = args.latency / 1000
+    for site in FAKE_SITES:
+        A.site_clients[site] = with_latency(A.site_clients[site], delay)
+
+    results = {}
+    if "search" in groups:
+        bench_search(A, sizes, args, results)
+    if groups & {"filter", "stats"}:
+        bench_filter_stats(A, sizes, args, results, groups)
+    if "analytics" in groups:
+        bench_analytics(A, args, results)
+    if "db" in groups:
+        bench_db(A, sizes, args, results)
+    if "dedupe" in groups:
+        bench_dedupe(A, sizes, args, results)
+    A.ingest_queue.close()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "sizes": sizes,
+            "rules": args.rules,
+            "latency_ms": args.latency,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    out = json.dumps(report, indent=2)
+    if out_path:
+        out_path.write_text(out)
+    else:
+        print(out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#Import-time budget: how long importing the app / the trend modules takes and what gets pulled in.
+#
+#   python benchmarks/import_time.py        # prints JSON, exits 1 when something is over budget
+#
+# Budgets are for our own code only (self time of app + trend.* modules, median of a few runs),
+# Flask and the stdlib cost what they cost. Heavy dependencies must not be imported at all,
+# they're loaded on first use (numpy for stats, grailed_api/requests with the Grailed client).
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+BUDGETS_MS = {
+    "app": 40.0,
+    "trend.search": 20.0,
+    "trend.api_clients": 8.0,
+}
+HEAVY = ("numpy", "grailed_api", "requests")
+RUNS = 5
+
+
+def own_module(name: str) -> bool:
+    return name == "app" or name == "trend" or name.startswith("trend.")
+
+
+def import_once(module: str) -> dict:
+    # bytecode caching on (the way workers run), -X importtime reports per module self/cumulative µs
+    env = {k: v for k, v in os.environ.items() if k != "PYTHONDONTWRITEBYTECODE"}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    own_us = 0
+    total_us = 0
+    loaded = set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        loaded.add(name)
+        if own_module(name):
+            own_us += int(self_us)
+        if name == module:
+            total_us = int(cumulative_us)
+    return {"own_ms": own_us / 1000, "total_ms": total_us / 1000, "heavy": sorted(m for m in HEAVY if m in loaded)}
+
+
+def main():
+    report = {}
+    ok = True
+    for module, budget in BUDGETS_MS.items():
+        import_once(module)  # writes the .pyc files
+        runs = [import_once(module) for _ in range(RUNS)]
+        own = statistics.median(r["own_ms"] for r in runs)
+        heavy = runs[-1]["heavy"]
+        passed = own <= budget and not heavy
+        ok = ok and passed
+        report[module] = {
+            "own_ms": round(own, 2),
+            "total_ms": round(statistics.median(r["total_ms"] for r in runs), 2),
+            "budget_ms": budget,
+            "heavy_imports": heavy,
+            "ok": passed,
+        }
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
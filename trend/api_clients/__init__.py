@@ -0,0 +1,100 @@
+#Import from here without everything breaking since not single.
+#Registry of the marketplaces: site name, domain and what it can filter upstream.
+#A client module is only imported (and the client built) the first time its site is used,
+#so importing the app doesn't pay for grailed_api/requests.
+import importlib
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, MutableMapping
+
+
+@dataclass(frozen=True)
+class SiteInfo:
+    site: str
+    label: str  # shown in the UI
+    domain: str  # relative listing urls are made absolute with this
+    module: str  # where the client class lives, relative to this package
+    class_name: str
+    # search() filters the site applies itself, see trend/planner.py
+    capabilities: frozenset = frozenset()
+
+
+_sites: Dict[str, SiteInfo] = {}
+_clients: Dict[str, object] = {}
+_lock = threading.Lock()
+
+
+def register(site: str, label: str, domain: str, module: str, class_name: str, capabilities=()) -> None:
+    _sites[site] = SiteInfo(site, label, domain, module, class_name, frozenset(capabilities))
+
+
+register("grailed", "Grailed", "https://www.grailed.com", ".grailed_client", "GrailedClient", {"min_price", "max_price", "brand"})
+# the simulated ones only generate prices inside the bounds they're given
+register("mercari_us", "Mercari US (simulated)", "https://www.mercari.com", ".mercari_us_client", "MercariUSClient", {"min_price", "max_price"})
+register("depop", "Depop (simulated)", "https://www.depop.com", ".depop_client_fake", "DepopClientFake", {"min_price", "max_price"})
+register("poshmark", "Poshmark (simulated)", "https://poshmark.com", ".poshmark_client_fake", "PoshmarkClientFake", {"min_price", "max_price"})
+register("facebook_marketplace", "Facebook Marketplace (simulated)", "https://www.facebook.com", ".facebook_marketplace_client_fake", "FacebookMarketplaceClientFake")
+
+
+def sites() -> List[str]:
+    """Registered site names, in registration order."""
+    return list(_sites)
+
+
+def site_info(site: str) -> SiteInfo | None:
+    return _sites.get(site)
+
+
+def get_client(site: str):
+    """The shared client for a site, imported and constructed on first use."""
+    client = _clients.get(site)
+    if client is not None:
+        return client
+    info = _sites[site]
+    with _lock:
+        if site not in _clients:
+            module = importlib.import_module(info.module, __name__)
+            _clients[site] = getattr(module, info.class_name)()
+        return _clients[site]
+
+
+class Clients(MutableMapping):
+    """
+    site -> client mapping over the registry, clients are built when first looked up.
+    Assigning a site swaps in another client object (e.g. a slowed down one in the benchmarks).
+    only: restrict the mapping to these sites (see pick()).
+    """
+
+    def __init__(self, only: Iterable[str] | None = None):
+        self._only = None if only is None else frozenset(only)
+
+    def __contains__(self, site):
+        return site in _sites and (self._only is None or site in self._only)
+
+    def __getitem__(self, site):
+        if site not in self:
+            raise KeyError(site)
+        return get_client(site)
+
+    def __setitem__(self, site, client):
+        if site not in self:
+            raise KeyError(site)
+        with _lock:
+            _clients[site] = client
+
+    def __delitem__(self, site):
+        raise TypeError("sites can't be removed from the registry")
+
+    def __iter__(self) -> Iterator[str]:
+        return (site for site in _sites if site in self)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def pick(self, selected) -> "Clients":
+        """
+        The selected sites that exist, in registry order. Still lazy: nothing is imported/built until
+        a site is looked up, so the search fan-out does that in each site's own job (and a client that
+        fails to build is that site's failure, not the whole request's).
+        """
+        return Clients([site for site in self if site in selected])
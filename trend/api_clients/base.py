@@ -1,13 +1,80 @@
+import functools
+import math
+import threading
 from abc import ABC, abstractmethod
-from typing import List
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterator, List
 
 from ..models import Listing
+from . import site_info
+from .guard import guarded
+from .http import POOL_MAXSIZE
+
+# iter_search() fetches the next page here while the current one is consumed.
+# Same size as the http pool so we never need more sockets than that.
+_page_executor = ThreadPoolExecutor(max_workers=POOL_MAXSIZE, thread_name_prefix="prefetch")
+# blocking calls made from the event loop (the default asearch() etc), a slow site that timed out
+# keeps its worker until it returns
+_blocking_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="blocking")
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def event_loop():
+    """The process wide event loop async searches run on, started in its own thread on first use."""
+    global _loop
+    # asyncio is imported where it's used, only searching needs it (~15ms at startup)
+    import asyncio
+
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="asearch-loop", daemon=True).start()
+            _loop = loop
+        return _loop
+
+
+def submit(coro) -> Future:
+    """Schedule a coroutine on the shared loop from normal (non async) code, e.g. a Flask view or the scheduler."""
+    import asyncio
+
+    return asyncio.run_coroutine_threadsafe(coro, event_loop())
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """Await a blocking call, it runs on the bounded worker pool instead of the loop."""
+    import asyncio
+
+    return await asyncio.get_running_loop().run_in_executor(_blocking_executor, functools.partial(fn, *args, **kwargs))
+
+
+def price_range(lo: int, hi: int, min_price: float | None, max_price: float | None) -> tuple[int, int]:
+    """Whole-dollar bounds inside [lo, hi] that keep every price between min_price and max_price."""
+    if min_price is not None:
+        lo = max(lo, math.ceil(min_price))
+    if max_price is not None:
+        hi = min(hi, math.floor(max_price))
+    return lo, hi
 
 
 class BaseMarketplaceClient(ABC):
     """Base for various clients (Grailed, Poshmark, Depop)."""
  # name of the site.
     site_name: str
+    @property
+    def capabilities(self) -> frozenset:
+        """search() filters the site applies itself (min_price, max_price, size, brand), declared in the registry."""
+        info = site_info(self.site_name)
+        return info.capabilities if info else frozenset()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # every search/search_page a client defines goes through the site's rate limit/retry/breaker (guard.py)
+        for name in ("search", "search_page"):
+            method = cls.__dict__.get(name)
+            if method is not None and not getattr(method, "__guarded__", False):
+                setattr(cls, name, guarded(method))
 
     @abstractmethod
     def search(
@@ -22,3 +89,73 @@ class BaseMarketplaceClient(ABC):
         """Return a list of normalized listing objects for the chosen marketplace."""
         #the subclass can't overide this
         raise NotImplementedError
+
+    async def asearch(
+        self,
+        query: str,
+        min_price: float | None = None,
+        max_price: float | None = None,
+        size: str | None = None,
+        brand: str | None = None,
+        limit: int = 40,
+    ) -> List[Listing]:
+        """
+        Async version of search(), what the fan-out calls (trend/search.py).
+        Default runs the blocking search() on the shared worker pool. A client with a native async API
+        overrides it and then costs no thread per search, it should go through site_guard() itself.
+        """
+        return await run_blocking(
+            self.search, query, min_price=min_price, max_price=max_price, size=size, brand=brand, limit=limit
+        )
+
+    def search_page(
+        self,
+        query: str,
+        page: int = 1,
+        page_size: int = 40,
+        min_price: float | None = None,
+        max_price: float | None = None,
+        size: str | None = None,
+        brand: str | None = None,
+    ) -> List[Listing]:
+        """
+        One page of results, pages start at 1.
+        Clients that can't page upstream just have a single page (plain search()).
+        """
+        if page > 1:
+            return []
+        return self.search(query, min_price=min_price, max_price=max_price, size=size, brand=brand, limit=page_size)
+
+    def iter_search(
+        self,
+        query: str,
+        page_size: int = 40,
+        max_items: int | None = None,
+        **filters,
+    ) -> Iterator[Listing]:
+        """
+        Lazily yields listings page by page so callers can stop as soon as they have enough.
+        The next page is fetched in the background while the current one is being consumed.
+        Stops at a short (last) page, at max_items, or when the caller stops iterating.
+        """
+        page = 1
+        pending = _page_executor.submit(self.search_page, query, page, page_size, **filters)
+        yielded = 0
+        try:
+            while pending is not None:
+                items = pending.result()
+                pending = None
+                more_wanted = max_items is None or yielded + len(items) < max_items
+                if len(items) >= page_size and more_wanted:
+                    page += 1
+                    pending = _page_executor.submit(self.search_page, query, page, page_size, **filters)
+
+                for item in items:
+                    yield item
+                    yielded += 1
+                    if max_items is not None and yielded >= max_items:
+                        return
+        finally:
+            # caller stopped early, don't fetch a page nobody will read
+            if pending is not None:
+                pending.cancel()
@@ -1,7 +1,7 @@
 from typing import List
 from datetime import datetime, timedelta
 import random
-from .base import BaseMarketplaceClient
+from .base import BaseMarketplaceClient, price_range
 from ..models import Listing
 
 
@@ -11,7 +11,12 @@ class DepopClientFake(BaseMarketplaceClient):
     site_name = "depop"
 
     def search(self, query, min_price=None, max_price=None, limit=20, **kwargs):
+        return self.search_page(query, page=1, page_size=limit, min_price=min_price, max_price=max_price)
+
+    def search_page(self, query, page=1, page_size=20, min_price=None, max_price=None, **kwargs):
         # implement API afterwards 
+        # later pages just continue the fake ids
+        start = (page - 1) * page_size
         print("generating fake depop items...")
 
         #Common listing Items that could be seen 
@@ -22,14 +27,18 @@ class DepopClientFake(BaseMarketplaceClient):
 
         brands = ["Brandy Melville", "Nike", "Adidas", "Harley Davidson", "Juicy Couture"]
         
+        lo, hi = price_range(15, 120, min_price, max_price)
+        if lo > hi:
+            return []
+
         out = []
-        for i in range(limit):
+        for i in range(start, start + page_size):
             t = random.choice(templates).format(query.capitalize())
             out.append(Listing(
                 site="depop",
                 listing_id=f"fake-depop-{i}",
                 title=t,
-                price=float(random.randint(15, 120)),
+                price=float(random.randint(lo, hi)),
                 currency="USD",
                 url=f"https://www.depop.com/products/fake-depop-{i}/",
                 brand=random.choice(brands),
@@ -1,26 +1,44 @@
 #using unofficial grailed API that we found 
+import math
 from typing import List
 from datetime import datetime
 
 from grailed_api import GrailedAPIClient
 from grailed_api.enums import Markets
+from grailed_api.services.api_service import ApiService
 
 from .base import BaseMarketplaceClient
+from .http import install_pool
 from ..models import Listing
 
+# one wrapper for every GrailedClient, grailed_api keeps a single session for all its services
+_api_client = None
+
+
+def _shared_api_client() -> GrailedAPIClient:
+    global _api_client
+    if _api_client is None:
+        install_pool(ApiService._session)
+        _api_client = GrailedAPIClient()
+    return _api_client
+
 
 #Grailed client
 class GrailedClient(BaseMarketplaceClient):
     site_name = "grailed"
 
     def __init__(self):
-        self._client = GrailedAPIClient()
+        self._client = _shared_api_client()
 
     def search(self, query, min_price=None, max_price=None, size=None, brand=None, limit=20):
+        return self.search_page(query, page=1, page_size=limit, min_price=min_price, max_price=max_price, size=size, brand=brand)
+
+    def search_page(self, query, page=1, page_size=40, min_price=None, max_price=None, size=None, brand=None):
         # using the unofficial api wrapper
         # Need to figure out why it doesn't display sometimes 
-        p_min = int(min_price or 0)
-        p_max = int(max_price or 999999)
+        # grailed takes whole dollars, round outwards so nothing in range is cut off
+        p_min = math.floor(min_price or 0)
+        p_max = math.ceil(max_price) if max_price is not None else 999999
 
         q = query
         if brand:
@@ -31,8 +49,8 @@ class GrailedClient(BaseMarketplaceClient):
             sold=False,
             on_sale=True,
             query_search=q,
-            page=1,
-            hits_per_page=limit,
+            page=page,
+            hits_per_page=page_size,
             price_from=p_min,
             price_to=p_max,
             designers=[brand] if brand else (),
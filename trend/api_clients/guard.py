@@ -0,0 +1,224 @@
+#Keeps a struggling marketplace from slowing down every request:
+#rate limit per site, retry with backoff, and a circuit breaker that fails fast while the site is down
+import functools
+import random
+import re
+import sys
+import threading
+import time
+
+from ..metrics import CLIENT_ERRORS, CLIENT_REJECTED, CLIENT_RETRIES, CLIENT_SECONDS
+
+# requests per second + burst each site gets from us
+DEFAULT_RATE = (10.0, 20)
+SITE_RATES = {
+    "grailed": (2.0, 5),
+    "mercari_us": (20.0, 40),
+    "depop": (20.0, 40),
+    "poshmark": (20.0, 40),
+    "facebook_marketplace": (20.0, 40),
+}
+MAX_RATE_WAIT = 1.0  # longer than this for a token -> fail instead of queueing
+
+RETRIES = 2  # extra attempts after the first one
+BACKOFF_BASE = 0.25
+BACKOFF_MAX = 2.0
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}  # http statuses worth another attempt
+
+FAILURE_THRESHOLD = 5  # failed calls in a row before the circuit opens
+OPEN_SECONDS = 30.0  # how long an open circuit rejects calls before letting one through
+
+
+class SiteUnavailable(Exception):
+    """Raised instead of calling the site (circuit open or rate limit), nothing was sent upstream."""
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, max_wait: float = MAX_RATE_WAIT) -> bool:
+        """Take one token, waiting up to max_wait for it. False if it would take longer."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = (1 - self._tokens) / self.rate if self._tokens < 1 else 0.0
+            if wait > max_wait:
+                return False
+            # reserve the token now, callers that wait queue up behind each other
+            self._tokens -= 1
+        if wait:
+            time.sleep(wait)
+        return True
+
+
+class CircuitBreaker:
+    """
+    closed -> open after FAILURE_THRESHOLD failures in a row.
+    open rejects calls for OPEN_SECONDS, then half open lets a single trial call through:
+    success closes it again, failure opens it for another round.
+    """
+
+    def __init__(self, threshold: int = FAILURE_THRESHOLD, open_seconds: float = OPEN_SECONDS):
+        self.threshold = threshold
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.open_seconds:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_running = False
+
+    def release(self) -> None:
+        """The call ended without telling us anything about the site, a half open trial can be retried."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == "half_open" or self.failures >= self.threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+def _status(e: Exception) -> int | None:
+    code = getattr(getattr(e, "response", None), "status_code", None)
+    if code is None and type(e).__name__ == "HttpError":
+        # grailed_api's HttpError only has the status in its message
+        m = re.search(r"Status (\d{3})", str(e))
+        code = int(m.group(1)) if m else None
+    return code
+
+
+def is_upstream_error(e: Exception) -> bool:
+    """
+    True when the site/network is to blame (connection problems, timeouts, 429/5xx), worth retrying and
+    counting towards the breaker. Anything else (parse bugs, bad arguments, 4xx) is raised right away.
+    """
+    if isinstance(e, (ConnectionError, TimeoutError)):
+        return True
+    status = _status(e)
+    if status is not None:
+        return status in RETRY_STATUSES
+    # requests is only loaded by the real clients, no need to import it here
+    requests = sys.modules.get("requests")
+    return requests is not None and isinstance(e, requests.RequestException)
+
+
+def backoff(attempt: int) -> float:
+    """Full jitter: random time between 0 and base * 2^attempt (capped)."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+class SiteGuard:
+    """Rate limiter + retries + circuit breaker for one site."""
+
+    def __init__(self, site: str):
+        self.site = site
+        self.bucket = TokenBucket(*SITE_RATES.get(site, DEFAULT_RATE))
+        self.breaker = CircuitBreaker()
+        self.calls = 0
+        self.retries = 0
+        self.rejected = 0
+        self.errors = 0
+
+    def call(self, fn, *args, **kwargs):
+        for attempt in range(RETRIES + 1):
+            # token first: allow() may hand out the half open trial call, which must then actually run
+            rejected = reason = None
+            if not self.bucket.acquire():
+                rejected, reason = f"{self.site} rate limit reached", "rate_limit"
+            elif not self.breaker.allow():
+                rejected, reason = f"{self.site} is failing, skipped for now (circuit open)", "circuit_open"
+            if rejected:
+                if attempt:
+                    # out of luck while retrying, report the real error
+                    raise last_error
+                self.rejected += 1
+                CLIENT_REJECTED.inc(self.site, reason)
+                raise SiteUnavailable(rejected)
+
+            self.calls += 1
+            try:
+                with CLIENT_SECONDS.time(self.site, fn.__name__):
+                    result = fn(*args, **kwargs)
+            except Exception as e:
+                self.errors += 1
+                CLIENT_ERRORS.inc(self.site)
+                if not is_upstream_error(e):
+                    # a bug on our side, retrying won't help and the site isn't down
+                    self.breaker.release()
+                    raise
+                self.breaker.record_failure()
+                if attempt == RETRIES:
+                    raise
+                last_error = e
+                self.retries += 1
+                CLIENT_RETRIES.inc(self.site)
+                print(f"{self.site} call failed ({e}), retrying")
+                time.sleep(backoff(attempt))
+            else:
+                self.breaker.record_success()
+                return result
+
+    def stats(self) -> dict:
+        return {"state": self.breaker.state,"failures": self.breaker.failures,"calls": self.calls,"retries": self.retries,"errors": self.errors,"rejected": self.rejected,}
+
+
+_guards: dict = {}
+_guards_lock = threading.Lock()
+# set while a guarded call runs, so search() -> search_page() is only guarded once
+_local = threading.local()
+
+
+def site_guard(site: str) -> SiteGuard:
+    with _guards_lock:
+        if site not in _guards:
+            _guards[site] = SiteGuard(site)
+        return _guards[site]
+
+
+def guard_stats() -> dict:
+    with _guards_lock:
+        return {site: g.stats() for site, g in _guards.items()}
+
+
+def guarded(method):
+    """Runs a client method through its site's guard (outermost call only)."""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if getattr(_local, "active", False):
+            return method(self, *args, **kwargs)
+        _local.active = True
+        try:
+            return site_guard(self.site_name).call(method, self, *args, **kwargs)
+        finally:
+            _local.active = False
+
+    wrapper.__guarded__ = True
+    return wrapper
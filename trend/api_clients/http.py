@@ -0,0 +1,32 @@
+#Shared HTTP connection pool for the real marketplace clients
+import threading
+
+# how many hosts we keep pools for, and how many keep-alive sockets per host
+POOL_CONNECTIONS = 10
+POOL_MAXSIZE = 8
+
+_lock = threading.Lock()
+_adapter = None
+
+
+def shared_adapter():
+    """
+    One bounded keep-alive adapter for the whole process.
+    pool_block=True means extra requests wait for a free socket instead of opening new ones.
+    """
+    global _adapter
+    # requests is only imported when a real client needs it
+    from requests.adapters import HTTPAdapter
+
+    with _lock:
+        if _adapter is None:
+            _adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, pool_block=True)
+        return _adapter
+
+
+def install_pool(session) -> None:
+    """Mount the shared adapter on a requests.Session (e.g. the one a 3rd party wrapper made)."""
+    adapter = shared_adapter()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
@@ -2,7 +2,7 @@ from typing import List
 from datetime import datetime, timedelta
 import random
 
-from .base import BaseMarketplaceClient
+from .base import BaseMarketplaceClient, price_range
 from ..models import Listing
 
 #Fake Marcari simulation
@@ -10,7 +10,12 @@ class MercariUSClient(BaseMarketplaceClient):
     site_name = "mercari_us"
 
     def search(self, query, min_price=None, max_price=None, limit=10, **kwargs):
+        return self.search_page(query, page=1, page_size=limit, min_price=min_price, max_price=max_price)
+
+    def search_page(self, query, page=1, page_size=10, min_price=None, max_price=None, **kwargs):
         # fake data generator for mercari
+        # later pages just continue the fake ids
+        start = (page - 1) * page_size
         print(f"DEBUG: getting fake mercari listings for {query}")
 
         titles = [
@@ -20,13 +25,17 @@ class MercariUSClient(BaseMarketplaceClient):
 
         brands = ["Carhartt", "Nike", "Adidas", "The North Face", "Columbia", "Patagonia"]
 
+        lo, hi = price_range(20, 250, min_price, max_price)
+        if lo > hi:
+            return []
+
         items = []
-        for i in range(limit):
+        for i in range(start, start + page_size):
             t = random.choice(titles).format(query.capitalize())
             
 
             # random price/date so it seems like real values
-            p = random.randint(20, 250)
+            p = random.randint(lo, hi)
             dt = datetime.utcnow() - timedelta(days=random.randint(0, 30))
 
 
@@ -2,7 +2,7 @@ from typing import List
 from datetime import datetime, timedelta
 import random
 
-from .base import BaseMarketplaceClient
+from .base import BaseMarketplaceClient, price_range
 from ..models import Listing
 
 
@@ -10,7 +10,12 @@ class PoshmarkClientFake(BaseMarketplaceClient):
     site_name = "poshmark"
 
     def search(self, query, min_price=None, max_price=None, limit=20, **kwargs):
+        return self.search_page(query, page=1, page_size=limit, min_price=min_price, max_price=max_price)
+
+    def search_page(self, query, page=1, page_size=20, min_price=None, max_price=None, **kwargs):
         #One we get the real API this would be different 
+        # later pages just continue the fake ids
+        start = (page - 1) * page_size
         print(f"DEBUG: returning fake poshmark results for {query}")
 
         titles = [
@@ -20,10 +25,14 @@ class PoshmarkClientFake(BaseMarketplaceClient):
         
         #Popular brands we found on Poshmark
         brands = ["Aritzia", "Lululemon", "Free People", "Zara", "Madewell", "Anthropologie"]
+        lo, hi = price_range(25, 250, min_price, max_price)
+        if lo > hi:
+            return []
+
         results = []
-        for i in range(limit):
+        for i in range(start, start + page_size):
             # rndm price 25 to 250
-            p = random.randint(25, 250)
+            p = random.randint(lo, hi)
             
             # rnd date last 60 days
             days_ago = random.randint(0, 60)
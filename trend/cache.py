@@ -0,0 +1,212 @@
+#In-process cache for marketplace search results
+#so clicking around the watch pages doesn't hit every site again for the same query
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Awaitable, Callable, List
+
+from .models import Listing
+
+# how long (seconds) results stay fresh per site
+DEFAULT_TTL = 60.0
+SITE_TTLS = {
+    "grailed": 120.0,
+    "mercari_us": 30.0,
+    "depop": 30.0,
+    "poshmark": 30.0,
+    "facebook_marketplace": 300.0,
+}
+MAX_ENTRIES = 512
+MAX_BYTES = 32 * 1024 * 1024
+# expired results are kept (until evicted) and served for this long if the site is erroring
+MAX_STALE = 3600.0
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase and collapse spaces so 'Nike  Jacket' and 'nike jacket' share an entry."""
+    return " ".join((query or "").lower().split())
+
+
+def cache_key(site, query, min_price=None, max_price=None, size=None, brand=None, limit=20) -> tuple:
+    return (site, normalize_query(query), min_price, max_price, size, brand, limit)
+
+
+def approx_size(listings: List[Listing]) -> int:
+    """Rough memory use of a result list (object + its string fields), good enough for the byte limit."""
+    total = sys.getsizeof(listings)
+    for l in listings:
+        total += sys.getsizeof(l)
+        for value in (l.title, l.url, l.brand, l.size, l.condition, l.image_url, l.listing_id):
+            if value:
+                total += sys.getsizeof(value)
+    return total
+
+
+class SearchCache:
+    """
+    TTL + LRU cache, bounded by number of entries and approx bytes.
+    Concurrent misses for the same key share one upstream call (single-flight).
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES, ttls=None, default_ttl=DEFAULT_TTL, max_stale=MAX_STALE):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttls = SITE_TTLS if ttls is None else ttls
+        self.default_ttl = default_ttl
+        self.max_stale = max_stale
+
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()  # key -> (expires_at, size, listings)
+        self._inflight: dict = {}  # key -> Future for the call in progress
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+        self.coalesced = 0
+        self.stale_served = 0
+
+    def get_or_fetch(self, key: tuple, fetch: Callable[[], List[Listing]]) -> List[Listing]:
+        """
+        Cached result or fetch() it. If fetch() fails and there's an expired (but not too old)
+        result for the key, that one is returned instead of the error.
+        """
+        hit, flight, stale = self._begin(key)
+        if hit is not None:
+            return hit
+        if stale is False:
+            # someone else is already fetching this, wait for their answer
+            return list(flight.result())
+        try:
+            result = list(fetch())
+        except Exception as e:
+            return self._finish(key, flight, stale, error=e)
+        return self._finish(key, flight, stale, result=result)
+
+    async def aget_or_fetch(self, key: tuple, fetch: Callable[[], Awaitable[List[Listing]]]) -> List[Listing]:
+        """get_or_fetch() for coroutines, fetch() returns an awaitable and waiting doesn't block the loop."""
+        import asyncio
+
+        hit, flight, stale = self._begin(key)
+        if hit is not None:
+            return hit
+        if stale is False:
+            return list(await asyncio.wrap_future(flight))
+        try:
+            result = list(await fetch())
+        except asyncio.CancelledError:
+            # a fan-out deadline gave up on this search, the waiters still need an answer
+            self._abandon(key, flight, stale)
+            raise
+        except Exception as e:
+            return self._finish(key, flight, stale, error=e)
+        return self._finish(key, flight, stale, result=result)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "coalesced": self.coalesced,
+                "stale_served": self.stale_served,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def _begin(self, key):
+        """
+        (listings, None, None) on a hit.
+        Otherwise (None, flight, stale): stale is False when another caller is already fetching
+        (wait on flight), else we fetch and stale is the expired result to fall back on (or None).
+        """
+        stale = None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                now = time.monotonic()
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return list(entry[2]), None, None
+                self.expired += 1
+                if now - entry[0] <= self.max_stale:
+                    stale = entry[2]
+                else:
+                    self._remove(key)
+
+            flight = self._inflight.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return None, flight, False
+            flight = Future()
+            self._inflight[key] = flight
+            self.misses += 1
+        return None, flight, stale
+
+    def _finish(self, key, flight, stale, result=None, error=None) -> List[Listing]:
+        """Store/hand out what the fetch gave, raises its error unless there's a stale result to serve."""
+        try:
+            if error is None:
+                with self._lock:
+                    self._store(key, result)
+            elif stale is None:
+                flight.set_exception(error)
+                raise error
+            else:
+                # site is down/failing, old results beat none
+                print(f"serving stale {key[0]} results:", error)
+                result = stale
+                with self._lock:
+                    self.stale_served += 1
+            flight.set_result(result)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        return list(result)
+
+    def _abandon(self, key, flight, stale) -> None:
+        with self._lock:
+            self._inflight.pop(key, None)
+        if stale is None:
+            flight.set_exception(TimeoutError(f"{key[0]} search was cancelled"))
+        else:
+            flight.set_result(stale)
+
+    # helpers below expect self._lock to be held
+    def _store(self, key, listings):
+        size = approx_size(listings)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        ttl = self.ttls.get(key[0], self.default_ttl)
+        self._entries[key] = (time.monotonic() + ttl, size, listings)
+        self._bytes += size
+
+        # evict least recently used until we're back under both limits
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+
+search_cache = SearchCache()
+
+
+async def acached_search(client, query: str, limit: int = 20, **filters) -> List[Listing]:
+    """client.asearch() through the shared cache."""
+    key = cache_key(client.site_name, query, limit=limit, **filters)
+    return await search_cache.aget_or_fetch(key, lambda: client.asearch(query, limit=limit, **filters))
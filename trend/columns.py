@@ -0,0 +1,88 @@
+#Column (numpy) view of a result set so stats/analytics don't loop over Listing objects again and again
+import math
+from datetime import datetime, timezone
+from functools import cached_property
+from typing import List
+
+import numpy as np
+
+from .models import Listing
+
+
+def _epoch(dt: datetime | None) -> float:
+    """Seconds since epoch, naive datetimes are treated as UTC. NaN when there's no date."""
+    if dt is None:
+        return math.nan
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+class ListingBatch:
+    """
+    Price, site code and timestamp columns for a list of listings, built once per search.
+    Missing prices/dates are NaN. site_names[code] gives the site back, in first-seen order.
+    """
+
+    def __init__(self, listings: List[Listing]):
+        self.listings = listings if isinstance(listings, list) else list(listings)
+        n = len(self.listings)
+
+        site_index: dict = {}
+        self.site_codes = np.array(
+            [site_index.setdefault(l.site, len(site_index)) for l in self.listings], dtype=np.int32
+        )
+        self.site_names = list(site_index)
+        # None -> NaN when numpy converts to float64
+        self.prices = np.array([l.price for l in self.listings], dtype=np.float64).reshape(n)
+
+    @cached_property
+    def created(self) -> np.ndarray:
+        # only the trend chart needs dates, so they're converted on first use
+        return np.fromiter((_epoch(l.created_at) for l in self.listings), dtype=np.float64, count=len(self.listings))
+
+    def __len__(self):
+        return len(self.listings)
+
+
+def compute_stats(batch: ListingBatch) -> dict:
+    """Same stats dict as before (total, by_site, averages, cheapest), computed on the columns."""
+    if len(batch) == 0:
+        return {"total": 0,"by_site": {},"avg_price_overall": None,"avg_price_by_site": {},"cheapest": None,}
+
+    n_sites = len(batch.site_names)
+    counts = np.bincount(batch.site_codes, minlength=n_sites)
+    by_site = {batch.site_names[i]: int(c) for i, c in enumerate(counts)}
+
+    # 0 / missing prices don't count towards averages
+    priced = batch.prices > 0  # NaN compares False
+    priced_codes = batch.site_codes[priced]
+    priced_prices = batch.prices[priced]
+    site_sums = np.bincount(priced_codes, weights=priced_prices, minlength=n_sites)
+    site_counts = np.bincount(priced_codes, minlength=n_sites)
+    by_site_avg = {
+        batch.site_names[i]: round(float(site_sums[i] / site_counts[i]), 2) for i in range(n_sites) if site_counts[i]
+    }
+    avg_overall = round(float(priced_prices.mean()), 2) if priced_prices.size else None
+
+    # cheapest of everything that has a price (first one wins on ties)
+    cheapest = None
+    if not np.isnan(batch.prices).all():
+        cheapest = batch.listings[int(np.nanargmin(batch.prices))]
+
+    return {"total": len(batch),"by_site": by_site,"avg_price_overall": avg_overall,"avg_price_by_site": by_site_avg,"cheapest": cheapest,}
+
+
+def trend_series(batch: ListingBatch) -> list:
+    """
+    Scatter points for /analytics sorted by date, only listings with a date and a non-zero price.
+    (Per-item price lines come from the stored history, see trend/history.py.)
+    """
+    dated = np.flatnonzero(~np.isnan(batch.created) & (batch.prices != 0) & ~np.isnan(batch.prices))
+    order = dated[np.argsort(batch.created[dated], kind="stable")]
+
+    points = []
+    for i in order.tolist():
+        m = batch.listings[i]
+        points.append({"title": m.title,"date": m.created_at.isoformat(),"price": m.price,"site": m.site,})
+    return points
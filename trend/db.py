@@ -1,16 +1,90 @@
 import sqlite3
+import threading
 from pathlib import Path
 #DB setup
 DB_PATH = Path("marketwatcher.db")
+
+# applied once per pooled connection
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",  # readers don't block the writer and vice versa
+    "PRAGMA synchronous=NORMAL",  # safe with WAL, far fewer fsyncs
+    "PRAGMA cache_size=-20000",  # ~20MB page cache per connection
+    "PRAGMA mmap_size=268435456",  # 256MB memory mapped reads
+    "PRAGMA temp_store=MEMORY",
+)
+STATEMENT_CACHE = 256  # prepared statements kept per connection
+BUSY_TIMEOUT = 10.0  # seconds a writer waits for another writer
+SQL_CHUNK = 500  # keys per IN (...) query, well under sqlite's bound parameter limit
+
+_local = threading.local()
+# DB files whose tables this process already created, so it's done once on the first connection
+_initialized = set()
+_init_lock = threading.Lock()
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    Connection that lives for the whole thread.
+    close() just hands it back (callers keep the usual get_conn()/close() pattern),
+    transactions are still committed/rolled back by the caller.
+    """
+
+    def close(self):
+        pass
+
+    def close_for_real(self):
+        super().close()
+
+
 def get_conn():
-    """Return a SQLite connection with row access by column name."""
-    conn = sqlite3.connect(DB_PATH)
+    """Return this thread's SQLite connection (opened on first use) with row access by column name."""
+    pooled = getattr(_local, "conn", None)
+    if pooled is not None and pooled[0] == DB_PATH:
+        return pooled[1]
+    if pooled is not None:
+        # DB_PATH was changed, don't keep using the old file
+        pooled[1].close_for_real()
+
+    conn = sqlite3.connect(
+        DB_PATH, timeout=BUSY_TIMEOUT, factory=PooledConnection, cached_statements=STATEMENT_CACHE
+    )
     conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    _local.conn = (DB_PATH, conn)
+    _ensure_schema(conn)
     return conn
-#Create table if not existing
+
+
+def _ensure_schema(conn):
+    with _init_lock:
+        if DB_PATH in _initialized:
+            return
+        _create_schema(conn)
+        _initialized.add(DB_PATH)
+
+
+def close_conn():
+    """Really close this thread's connection, e.g. at shutdown."""
+    pooled = getattr(_local, "conn", None)
+    if pooled is not None:
+        pooled[1].close_for_real()
+        _local.conn = None
+
+
+def chunks(keys: list):
+    """keys in SQL_CHUNK sized slices, for IN (...) lookups."""
+    for i in range(0, len(keys), SQL_CHUNK):
+        yield keys[i:i + SQL_CHUNK]
+
+
 def init_db():
-    """Create the listings table if it does not exist."""
-    conn = get_conn()
+    """Create the tables if they don't exist. Also happens on its own with the first get_conn()."""
+    get_conn()
+
+
+#Create table if not existing
+def _create_schema(conn):
     c = conn.cursor()
 
     c.execute(
@@ -32,7 +106,196 @@ def init_db():
         );
         """
     )
+    # one row per listing per site so re-fetching a listing updates it instead of duplicating.
+    # Old DBs get their duplicates removed once, before the unique index exists (it's a full scan
+    # holding the write lock, so not something every worker's first connection should do)
+    has_unique = c.execute("SELECT 1 FROM sqlite_master WHERE name = 'idx_listings_site_listing'").fetchone()
+    if not has_unique:
+        c.execute(
+            """
+            DELETE FROM listings
+            WHERE id NOT IN (SELECT MAX(id) FROM listings GROUP BY site, listing_id)
+            """
+        )
+        c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_listings_site_listing ON listings (site, listing_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_listings_created_at ON listings (created_at)")
+
+    # full text index over title/brand, triggers keep it in sync with listings
+    has_fts = c.execute("SELECT 1 FROM sqlite_master WHERE name = 'listings_fts'").fetchone()
+    c.execute(
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS listings_fts
+        USING fts5(title, brand, content='listings', content_rowid='id')
+        """
+    )
+    c.executescript(
+        """
+        CREATE TRIGGER IF NOT EXISTS listings_fts_insert AFTER INSERT ON listings BEGIN
+            INSERT INTO listings_fts (rowid, title, brand) VALUES (new.id, new.title, new.brand);
+        END;
+        CREATE TRIGGER IF NOT EXISTS listings_fts_delete AFTER DELETE ON listings BEGIN
+            INSERT INTO listings_fts (listings_fts, rowid, title, brand) VALUES ('delete', old.id, old.title, old.brand);
+        END;
+        CREATE TRIGGER IF NOT EXISTS listings_fts_update AFTER UPDATE OF title, brand ON listings BEGIN
+            INSERT INTO listings_fts (listings_fts, rowid, title, brand) VALUES ('delete', old.id, old.title, old.brand);
+            INSERT INTO listings_fts (rowid, title, brand) VALUES (new.id, new.title, new.brand);
+        END;
+        """
+    )
+    if not has_fts:
+        # index rows that were there before the fts table existed
+        c.execute("INSERT INTO listings_fts (listings_fts) VALUES ('rebuild')")
+
+    # per (query, site, day) price rollup for analytics, filled in by trend.ingest
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS price_daily (
+            query_key TEXT NOT NULL,
+            site TEXT NOT NULL,
+            day TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            total REAL NOT NULL,
+            min_price REAL,
+            max_price REAL,
+            total_sq REAL NOT NULL,
+            PRIMARY KEY (query_key, site, day)
+        ) WITHOUT ROWID;
+        """
+    )
+    # watch rules, shared by every worker process (see trend/rules.py)
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS watch_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            query TEXT NOT NULL,
+            tags TEXT NOT NULL DEFAULT '[]',
+            max_price REAL,
+            sites TEXT NOT NULL DEFAULT '[]',
+            interval REAL,
+            created_at TEXT
+        );
+        """
+    )
+    # small key/value counters, e.g. the watch rules version used for cache invalidation
+    c.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    c.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('watch_rules_version', 0)")
+
+    # listings each watch rule has already reported, see trend/seen.py
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS seen_listings (
+            rule_id INTEGER NOT NULL,
+            listing_key TEXT NOT NULL,
+            first_seen TEXT NOT NULL,
+            last_seen TEXT NOT NULL,
+            PRIMARY KEY (rule_id, listing_key)
+        ) WITHOUT ROWID;
+        """
+    )
+    c.execute("CREATE INDEX IF NOT EXISTS idx_seen_listings_last_seen ON seen_listings (last_seen)")
+
+    # which listings are already counted for a query, so re-fetching doesn't count twice
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS price_daily_members (
+            query_key TEXT NOT NULL,
+            site TEXT NOT NULL,
+            listing_id TEXT NOT NULL,
+            PRIMARY KEY (query_key, site, listing_id)
+        ) WITHOUT ROWID;
+        """
+    )
+
+    # which listings are the same item (cross-posts, relists), see trend/dedupe.py
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS listing_clusters (
+            listing_key TEXT PRIMARY KEY,
+            cluster_key TEXT NOT NULL,
+            price REAL,
+            currency TEXT,
+            size TEXT,
+            url TEXT,
+            signature BLOB NOT NULL
+        ) WITHOUT ROWID;
+        """
+    )
+    c.execute("CREATE INDEX IF NOT EXISTS idx_listing_clusters_cluster ON listing_clusters (cluster_key)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_listing_clusters_url ON listing_clusters (url)")
+    # LSH buckets: one row per (band hash, listing)
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS listing_bands (
+            band INTEGER NOT NULL,
+            listing_key TEXT NOT NULL,
+            PRIMARY KEY (band, listing_key)
+        ) WITHOUT ROWID;
+        """
+    )
+
+    # one row per item (= duplicate cluster), see trend/history.py
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS items (
+            item_key TEXT PRIMARY KEY,
+            url TEXT,
+            title TEXT,
+            currency TEXT,
+            first_observed TEXT NOT NULL,
+            last_observed TEXT NOT NULL,
+            last_price REAL,
+            observations INTEGER NOT NULL
+        ) WITHOUT ROWID;
+        """
+    )
+    # append only, a row when a listing is first seen and then only when its price changes
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS price_observations (
+            item_key TEXT NOT NULL,
+            observed_at TEXT NOT NULL,
+            listing_key TEXT NOT NULL,
+            site TEXT NOT NULL,
+            price REAL NOT NULL,
+            PRIMARY KEY (item_key, observed_at, listing_key)
+        ) WITHOUT ROWID;
+        """
+    )
+    c.execute("CREATE INDEX IF NOT EXISTS idx_price_observations_listing ON price_observations (listing_key, observed_at)")
+
+    # latest result per watch rule and new items nobody was shown yet, see trend/rule_state.py
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS rule_state (
+            rule_id INTEGER PRIMARY KEY,
+            rule TEXT NOT NULL,
+            matches TEXT NOT NULL DEFAULT '[]',
+            updated_at TEXT,
+            error TEXT,
+            version INTEGER NOT NULL
+        );
+        """
+    )
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS rule_new_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            rule_id INTEGER NOT NULL,
+            listing TEXT NOT NULL
+        );
+        """
+    )
+    c.execute("CREATE INDEX IF NOT EXISTS idx_rule_new_items_rule ON rule_new_items (rule_id, id)")
+    # which process runs a job that only one of them should (the rule scheduler)
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        ) WITHOUT ROWID;
+        """
+    )
 
 
     conn.commit()
-    conn.close()
\ No newline at end of file
@@ -0,0 +1,384 @@
+#Finds the same item cross-posted on several marketplaces (or relisted under a new id) so it's shown/counted once
+import hashlib
+import random
+from array import array
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Tuple
+from urllib.parse import urlsplit
+
+from .db import chunks, get_conn
+from .lru import LRU
+from .metrics import timed
+from .models import Listing, listing_key
+from .percolator import words
+
+NUM_PERM = 64  # minhash values per listing
+BANDS = 16  # LSH bands of NUM_PERM / BANDS rows, pairs above ~0.5 similarity usually share a band
+ROWS = NUM_PERM // BANDS
+SIMILARITY = 0.75  # estimated jaccard of the shingles needed to call two listings the same item
+PRICE_TOLERANCE = 0.10  # and their prices can't be further apart than this (fraction of the higher one)
+MAX_BUCKET = 32  # stored listings looked at per band, so very common titles don't make a lookup linear
+LRU_SIZE = 100_000  # stored listings (cluster + signature, ~400 bytes each) kept in memory in front of the tables
+
+# one random 64 bit mask per minhash value, h ^ mask stands in for a hash permutation
+# (a lot cheaper than (a*h + b) mod p in python, and good enough for titles this short)
+_rng = random.Random(20250101)  # fixed, signatures are stored and compared across restarts
+_MASKS = [_rng.getrandbits(64) for _ in range(NUM_PERM)]
+
+
+def canonical_url(url: str | None) -> str | None:
+    """Scheme, query string, fragment and trailing slash dropped, host lowercased."""
+    if not url:
+        return None
+    parts = urlsplit(url.strip())
+    if not parts.netloc:
+        return url.strip().rstrip("/") or None
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    return host + parts.path.rstrip("/")
+
+
+@lru_cache(maxsize=65536)
+def shingles(title: str, brand: str, size: str) -> frozenset:
+    """Title words and word pairs, plus brand and size, all normalized."""
+    ws = words(title)
+    out = set(ws)
+    out.update(f"{a} {b}" for a, b in zip(ws, ws[1:]))
+    if brand:
+        out.add("brand:" + " ".join(words(brand)))
+    if size:
+        out.add("size:" + " ".join(words(size)))
+    return frozenset(out)
+
+
+def _shingle_hash(s: str) -> int:
+    # not hash(), that one changes with every process
+    return int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "little")
+
+
+@lru_cache(maxsize=65536)
+def minhash(sh: frozenset) -> Tuple[int, ...]:
+    if not sh:
+        return ()
+    hashes = [_shingle_hash(s) for s in sh]
+    # low 32 bits are plenty to compare, and the signature stays 256 bytes
+    return tuple(min(map(m.__xor__, hashes)) & 0xFFFFFFFF for m in _MASKS)
+
+
+def signature(l: Listing) -> Tuple[int, ...]:
+    return minhash(shingles(l.title or "", l.brand or "", l.size or ""))
+
+
+@lru_cache(maxsize=65536)
+def band_keys(sig: Tuple[int, ...]) -> Tuple[int, ...]:
+    """One bucket key per band, signed 64 bit so SQLite stores it as an INTEGER."""
+    if not sig:
+        return ()
+    keys = []
+    for i in range(BANDS):
+        chunk = array("I", sig[i * ROWS:(i + 1) * ROWS]).tobytes()
+        digest = hashlib.blake2b(chunk, digest_size=8, person=i.to_bytes(2, "little")).digest()
+        keys.append(int.from_bytes(digest, "little", signed=True))
+    return tuple(keys)
+
+
+def similarity(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+    """Estimated jaccard similarity of two signatures."""
+    if not a or len(a) != len(b):
+        return 0.0
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+_BUCKET_SQL = "SELECT * FROM (SELECT listing_key FROM listing_bands WHERE band = ? LIMIT ?)"
+_URL_SQL = "SELECT * FROM (SELECT listing_key FROM listing_clusters WHERE url = ? LIMIT ?)"
+_ROW_SQL = "SELECT listing_key, cluster_key, price, currency, size, url, signature FROM listing_clusters"
+
+
+class _Entry:
+    __slots__ = ("key", "cluster", "price", "currency", "size", "url", "sig")
+
+    def __init__(self, key, cluster, price, currency, size, url, sig):
+        self.key = key
+        self.cluster = cluster
+        self.price = price
+        self.currency = currency
+        self.size = size
+        self.url = url
+        self.sig = sig
+
+
+def _entry(l: Listing, cluster: str | None = None) -> _Entry:
+    return _Entry(listing_key(l), cluster, l.price, l.currency, l.size, canonical_url(l.url), signature(l))
+
+
+def _row_entry(r) -> _Entry:
+    # kept as a compact array (the LRU holds these), band_keys() wants tuple(sig)
+    return _Entry(r[0], r[1], r[2], r[3], r[4], r[5], array("I", r[6]))
+
+
+def _score(a: _Entry, b: _Entry, use_url: bool = True) -> float:
+    """How sure we are a and b are the same item, 0 when they aren't."""
+    if use_url and a.url and a.url == b.url:
+        # same page = same item, even if the title/price got edited in between
+        return 2.0
+    if a.currency != b.currency:
+        return 0.0
+    if a.size and b.size and a.size.strip().lower() != b.size.strip().lower():
+        return 0.0
+    if a.price and b.price and abs(a.price - b.price) > PRICE_TOLERANCE * max(a.price, b.price):
+        return 0.0
+    s = similarity(a.sig, b.sig)
+    return s if s >= SIMILARITY else 0.0
+
+
+def _still_same(e: _Entry, stored: _Entry) -> bool:
+    """
+    Whether a listing's stored row still describes it. Ids (and the urls made from them) do get reused,
+    the simulated clients hand out the same ids for every query, so the url alone doesn't count here.
+    """
+    return _score(e, stored, use_url=False) > 0 or (not e.sig and not stored.sig)
+
+
+def _moved_cluster(e: _Entry) -> str:
+    """Cluster name for a listing whose id was reused, its old cluster (named after it) may still have members."""
+    return e.key + "~" + hashlib.blake2b(array("I", e.sig).tobytes(), digest_size=4).hexdigest()
+
+
+class DuplicateIndex:
+    """
+    Clusters listings that are the same item, stored in the listing_clusters/listing_bands tables.
+
+    Each listing gets a MinHash signature of its normalized title/brand/size, the signature is cut
+    into LSH bands and stored under one bucket key per band. A new listing is only compared with
+    the stored listings sharing one of its buckets (capped per bucket) or its canonical url, so the
+    cost per listing doesn't grow with the table. It joins the cluster of the best match with a close
+    enough price, otherwise it starts its own cluster named after itself.
+
+    Reads (resolve, dedupe, keys) never write, so they're fine in a request: stored listings get their
+    stored cluster, the rest are clustered in memory against the other listings of the call.
+    assign()/add() store, that's the ingest writer and whatever persists the keys (seen rows, price
+    history), and from then on a listing keeps its cluster, unless its id turns up on a different item.
+    """
+
+    def __init__(self, lru_size: int = LRU_SIZE):
+        self._lru = LRU(lru_size)  # listing key -> stored _Entry
+
+    @timed("dedupe_resolve")
+    def resolve(self, listings: Iterable[Listing]) -> Dict[str, str]:
+        """
+        {listing key: cluster key} for listings with an id, read only.
+        Listings that aren't stored are only clustered in memory, their answer can still change once
+        they're stored, use assign() when the key gets persisted.
+        """
+        known, fresh, stale = self._lookup(listings)
+        clusters = {k: e.cluster for k, e in known.items()}
+        for e in self._assign(fresh, known=known.values(), stale=stale):
+            clusters[e.key] = e.cluster
+        return clusters
+
+    def assign(self, listings: Iterable[Listing]) -> Dict[str, str]:
+        """resolve() that stores the listings that aren't stored yet first, so the answer doesn't change later."""
+        known, fresh, stale = self._lookup(listings)
+        clusters = {k: e.cluster for k, e in known.items()}
+        if fresh:
+            clusters.update(self._store(fresh, stale)[0])
+        return clusters
+
+    def keys(self, listings: List[Listing], store: bool = False) -> List[str]:
+        """
+        Cluster key per listing (same order), listings without an id get ''.
+        store: go through assign(), for keys that are saved somewhere (seen_index keys on them).
+        """
+        clusters = self.assign(listings) if store else self.resolve(listings)
+        return [clusters.get(listing_key(l), "") if l.listing_id else "" for l in listings]
+
+    def dedupe(self, listings: Iterable[Listing], shown: set | None = None) -> List[Listing]:
+        """
+        One listing per cluster, the cheapest, in the order the clusters first appear.
+        shown: clusters already displayed (e.g. earlier sites of a streamed search), those are
+        dropped and the clusters kept here are added to it.
+        """
+        listings = list(listings)
+        clusters = self.resolve(listings)
+        out = []
+        at = {}
+        for l in listings:
+            c = clusters.get(listing_key(l)) if l.listing_id else None
+            if c is None:
+                out.append(l)
+                continue
+            if shown is not None and c in shown:
+                continue
+            i = at.get(c)
+            if i is None:
+                at[c] = len(out)
+                out.append(l)
+            elif l.price is not None and (out[i].price is None or l.price < out[i].price):
+                out[i] = l
+        if shown is not None:
+            shown.update(at)
+        return out
+
+    @timed("db_dedupe_add")
+    def add(self, listings: Iterable[Listing]) -> int:
+        """Store cluster assignments for listings not stored yet, returns how many rows this call wrote."""
+        _, fresh, stale = self._lookup(listings)
+        if not fresh:
+            return 0
+        return self._store(fresh, stale)[1]
+
+    # internals
+    def _lookup(self, listings) -> Tuple[Dict[str, _Entry], List[_Entry], Dict[str, _Entry]]:
+        """
+        ({key: stored entry} for listings whose row still matches them, entries to cluster (one per key),
+        {key: stored entry} for rows that describe something else now).
+        """
+        by_key = {}
+        for l in listings:
+            if l.listing_id:
+                by_key.setdefault(listing_key(l), l)
+        known, keys = self._lru.get_many(by_key)
+        if keys:
+            found = []
+            conn = get_conn()
+            try:
+                for chunk in chunks(keys):
+                    rows = conn.execute(f"{_ROW_SQL} WHERE listing_key IN ({','.join('?' * len(chunk))})", chunk)
+                    found.extend(_row_entry(r) for r in rows)
+            finally:
+                conn.close()
+            self._lru.put_many((e.key, e) for e in found)
+            known.update((e.key, e) for e in found)
+
+        entries = {k: _entry(l) for k, l in by_key.items()}
+        stale = {k: e for k, e in known.items() if not _still_same(entries[k], e)}
+        for k in stale:
+            del known[k]
+        return known, [e for k, e in entries.items() if k not in known], stale
+
+    def _store(self, fresh: List[_Entry], stale: Dict[str, _Entry]) -> Tuple[Dict[str, str], int]:
+        """
+        Cluster and store listings, returns ({listing key: stored cluster}, rows written).
+        New listings are INSERT OR IGNOREd, stale ones (see _lookup) get their row moved.
+        When another thread/worker stored a listing first its cluster wins, and batch mates that
+        joined our provisional cluster for it follow along.
+        """
+        clusters = {}
+        written = 0
+        conn = get_conn()
+        try:
+            entries = self._assign(fresh, conn=conn, stale=stale)
+            moved = {}  # provisional cluster key -> the one actually stored
+            with conn:
+                for e in entries:
+                    e.cluster = moved.get(e.cluster, e.cluster)
+                    blob = array("I", e.sig).tobytes()
+                    old = stale.get(e.key)
+                    if old is None:
+                        cur = conn.execute(
+                            """
+                            INSERT OR IGNORE INTO listing_clusters (listing_key, cluster_key, price, currency, size, url, signature)
+                            VALUES (?, ?, ?, ?, ?, ?, ?)
+                            """,
+                            (e.key, e.cluster, e.price, e.currency, e.size, e.url, blob),
+                        )
+                    else:
+                        # only if nobody moved it meanwhile
+                        cur = conn.execute(
+                            """
+                            UPDATE listing_clusters SET cluster_key = ?, price = ?, currency = ?, size = ?, url = ?, signature = ?
+                            WHERE listing_key = ? AND cluster_key = ? AND signature = ?
+                            """,
+                            (e.cluster, e.price, e.currency, e.size, e.url, blob, e.key, old.cluster, old.sig.tobytes()),
+                        )
+                        if cur.rowcount == 1:
+                            conn.executemany(
+                                "DELETE FROM listing_bands WHERE band = ? AND listing_key = ?",
+                                [(b, e.key) for b in band_keys(tuple(old.sig))],
+                            )
+                    if cur.rowcount == 1:
+                        conn.executemany(
+                            "INSERT OR IGNORE INTO listing_bands (band, listing_key) VALUES (?, ?)",
+                            [(b, e.key) for b in band_keys(e.sig)],
+                        )
+                        written += 1
+                    else:
+                        row = conn.execute(
+                            "SELECT cluster_key FROM listing_clusters WHERE listing_key = ?", (e.key,)
+                        ).fetchone()
+                        if e.cluster == e.key:
+                            moved[e.key] = row[0]
+                        e.cluster = row[0]
+                    clusters[e.key] = e.cluster
+                    e.sig = array("I", blob)
+        finally:
+            conn.close()
+        self._lru.put_many((e.key, e) for e in entries)
+        return clusters, written
+
+    def _candidates(self, conn, e: _Entry, bands: Tuple[int, ...]) -> List[_Entry]:
+        """Stored listings sharing a bucket (at most MAX_BUCKET per band) or the url, one query."""
+        parts = [_BUCKET_SQL] * len(bands)
+        params = [p for b in bands for p in (b, MAX_BUCKET)]
+        if e.url:
+            parts.append(_URL_SQL)
+            params += [e.url, MAX_BUCKET]
+        if not parts:
+            return []
+        # a bucket mate in another currency or price range can't match (_score), leave it in the table
+        if e.price:
+            lo, hi = e.price * (1 - PRICE_TOLERANCE), e.price / (1 - PRICE_TOLERANCE)
+        else:
+            lo, hi = float("-inf"), float("inf")
+        rows = conn.execute(
+            f"""
+            {_ROW_SQL}
+            WHERE listing_key IN ({" UNION ALL ".join(parts)}) AND listing_key != ?
+              AND (url = ? OR (currency IS ? AND (price IS NULL OR price = 0 OR price BETWEEN ? AND ?)))
+            """,
+            params + [e.key, e.url, e.currency, lo, hi],
+        ).fetchall()
+        return [_row_entry(r) for r in rows]
+
+    def _assign(self, fresh: List[_Entry], conn=None, known: Iterable[_Entry] = (), stale: Dict[str, _Entry] | None = None) -> List[_Entry]:
+        """
+        Set the cluster of entries that aren't stored: against the known (stored) entries and the earlier
+        ones of this batch, and with a connection also against the stored ones found through the buckets/url.
+        """
+        by_band = defaultdict(list)
+        by_url = defaultdict(list)
+
+        def index(e, bands):
+            for b in bands:
+                if len(by_band[b]) < MAX_BUCKET:
+                    by_band[b].append(e)
+            if e.url:
+                by_url[e.url].append(e)
+
+        for e in known:
+            index(e, band_keys(tuple(e.sig)))
+        for e in fresh:
+            bands = band_keys(e.sig)
+            candidates = self._candidates(conn, e, bands) if conn is not None else []
+            for b in bands:
+                candidates.extend(by_band[b])
+            if e.url:
+                candidates.extend(by_url[e.url])
+
+            best, best_score = None, 0.0
+            for c in candidates:
+                s = _score(e, c)
+                if s > best_score:
+                    best, best_score = c, s
+            if best is not None:
+                e.cluster = best.cluster
+            else:
+                e.cluster = _moved_cluster(e) if stale and e.key in stale else e.key
+
+            index(e, bands)
+        return fresh
+
+
+duplicate_index = DuplicateIndex()
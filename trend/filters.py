@@ -0,0 +1,86 @@
+#Fast tag / price filtering for search results
+import re
+from functools import lru_cache
+from typing import Iterable, List
+
+from .models import Listing
+
+
+class _NormTable(dict):
+    """
+    str.translate table that keeps letters/digits and drops punctuation and plain spaces.
+    keep_whitespace: also keep other whitespace (tabs, newlines), like the old loop did for listing text.
+    Filled in lazily, each character is only checked once per process.
+    """
+
+    def __init__(self, keep_whitespace: bool):
+        super().__init__()
+        self.keep_whitespace = keep_whitespace
+
+    def __missing__(self, code):
+        ch = chr(code)
+        value = ch if ch.isalnum() or (self.keep_whitespace and ch.isspace() and ch != " ") else None
+        self[code] = value
+        return value
+
+
+_TEXT_TABLE = _NormTable(keep_whitespace=True)
+_TAG_TABLE = _NormTable(keep_whitespace=False)
+
+
+def normalize(text: str) -> str:
+    """Lowercase + strip punctuation and spaces, so 'Y2K  Baby-Tee' -> 'y2kbabytee' (tabs/newlines stay)."""
+    return text.lower().translate(_TEXT_TABLE)
+
+
+def normalize_tag(tag: str) -> str:
+    """Lowercase + keep only letters/digits, a tag never matches on whitespace."""
+    return tag.lower().translate(_TAG_TABLE)
+
+
+@lru_cache(maxsize=65536)
+def listing_text(title: str, brand: str, size: str) -> str:
+    """Normalized title+brand+size, cached since the same listings get filtered by many rules."""
+    return normalize(title) + normalize(brand) + normalize(size)
+
+
+class CompiledFilter:
+    """
+    Tags (OR logic) and max price compiled once, then reusable over any number of listings.
+    All tags are matched with a single regex instead of looping over them per listing.
+    """
+
+    def __init__(self, tags: Iterable[str] | None = None, max_price: float | None = None):
+        raw = [t.strip() for t in (tags or []) if t.strip()]
+        self.tags = [t for t in (normalize_tag(t) for t in raw) if t]
+        self.max_price = max_price
+        # tags were given but none had a letter/digit in them -> nothing can match (same as before)
+        self._nothing_matches = bool(raw) and not self.tags
+        self._pattern = None
+        if self.tags:
+            # longest first so the alternation doesn't stop at a shorter tag
+            alternatives = sorted(set(self.tags), key=len, reverse=True)
+            self._pattern = re.compile("|".join(re.escape(t) for t in alternatives))
+
+    def matches(self, l: Listing) -> bool:
+        if self._nothing_matches:
+            return False
+        if self._pattern is not None:
+            text = listing_text(l.title or "", l.brand or "", l.size or "")
+            if self._pattern.search(text) is None:
+                return False
+        if self.max_price is not None and (l.price is None or l.price > self.max_price):
+            return False
+        return True
+
+    def __call__(self, listings: Iterable[Listing]) -> List[Listing]:
+        if self._nothing_matches:
+            return []
+        matches = self.matches
+        return [l for l in listings if matches(l)]
+
+
+@lru_cache(maxsize=1024)
+def compile_filter(tags: tuple = (), max_price: float | None = None) -> CompiledFilter:
+    """Cached CompiledFilter, rules with the same tags/price reuse one object."""
+    return CompiledFilter(tags, max_price)
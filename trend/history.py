@@ -0,0 +1,166 @@
+#Price history per item (not per listing): every post of an item shares one identity, only price changes are stored
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List
+
+from .db import chunks, get_conn
+from .dedupe import canonical_url, duplicate_index
+from .lru import LRU
+from .metrics import timed
+from .models import Listing, listing_key
+from .price_stats import weekly_price_change
+
+LRU_SIZE = 200_000  # listing -> last recorded price kept in memory in front of the table
+MAX_ITEM_LINES = 5  # items drawn per rule on /analytics
+
+OBSERVATION_SQL = """
+    INSERT OR IGNORE INTO price_observations (item_key, observed_at, listing_key, site, price)
+    VALUES (?, ?, ?, ?, ?)
+"""
+ITEM_UPSERT_SQL = """
+    INSERT INTO items (item_key, url, title, currency, first_observed, last_observed, last_price, observations)
+    VALUES (?, ?, ?, ?, ?, ?, ?, 1)
+    ON CONFLICT (item_key) DO UPDATE SET
+        url = COALESCE(items.url, excluded.url),
+        title = CASE WHEN excluded.last_observed >= items.last_observed THEN excluded.title ELSE items.title END,
+        last_price = CASE WHEN excluded.last_observed >= items.last_observed THEN excluded.last_price ELSE items.last_price END,
+        first_observed = MIN(items.first_observed, excluded.first_observed),
+        last_observed = MAX(items.last_observed, excluded.last_observed),
+        observations = items.observations + 1
+"""
+
+
+def _utc(dt: datetime) -> datetime:
+    """
+    Naive UTC datetime. Grailed gives aware datetimes, the other clients naive ones (treated as UTC,
+    same as columns._epoch), so everything is stored in one ISO format and compares in order as text.
+    """
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def weekly_change(points: List[dict]) -> float | None:
+    """Least squares price change per week over an item's observations (not just first vs last)."""
+    return weekly_price_change([{"date": p["date"][:10], "count": 1, "avg": p["price"]} for p in points])
+
+
+class PriceHistory:
+    """
+    Items and their price observations, stored in the items/price_observations tables.
+
+    The item is the duplicate cluster a listing belongs to (trend/dedupe.py), so a relist under a new id
+    or url, or the same thing on another site, continues the same series. An observation is appended
+    when a listing is first seen (at its created_at when the site gives one) and after that only when
+    its price changed, nothing is ever updated. Series are read with one range query on (item, time).
+    """
+
+    def __init__(self, lru_size: int = LRU_SIZE):
+        self._last = LRU(lru_size)  # listing key -> last recorded price
+
+    @timed("db_price_history_record")
+    def record(self, listings: Iterable[Listing]) -> int:
+        """Append observations for new listings / changed prices, returns how many were added."""
+        by_key = {}
+        for l in listings:
+            if l.listing_id and l.price and l.price > 0:
+                by_key[listing_key(l)] = l
+        if not by_key:
+            return 0
+        items = duplicate_index.assign(by_key.values())
+        # oldest first, so relists of an item come in order
+        ordered = sorted(by_key.items(), key=lambda kv: _utc(kv[1].created_at or kv[1].scraped_at))
+
+        added = []
+        conn = get_conn()
+        try:
+            last = self._last_prices(conn, list(by_key))
+            with conn:
+                for k, l in ordered:
+                    prev = last.get(k)
+                    if prev == l.price:
+                        continue
+                    at = _utc(l.created_at if prev is None and l.created_at else l.scraped_at).isoformat(timespec="microseconds")
+                    cur = conn.execute(OBSERVATION_SQL, (items[k], at, k, l.site, l.price))
+                    if cur.rowcount != 1:
+                        continue
+                    conn.execute(ITEM_UPSERT_SQL, (items[k], canonical_url(l.url), l.title, l.currency, at, at, l.price))
+                    added.append((k, l.price))
+        finally:
+            conn.close()
+
+        self._last.put_many(added)
+        return len(added)
+
+    def item_lines(self, item_keys: Iterable[str], limit: int = MAX_ITEM_LINES, since: str | None = None) -> List[dict]:
+        """
+        The most observed of these items with their price series, most observed first:
+        [{"item", "title", "url", "observations", "points": [{"date", "price", "site"}]}]
+        since: ISO date/time, only observations from then on.
+        """
+        keys = list(dict.fromkeys(k for k in item_keys if k))
+        if not keys:
+            return []
+        conn = get_conn()
+        try:
+            top = []
+            for chunk in chunks(keys):
+                top.extend(conn.execute(
+                    f"""
+                    SELECT item_key, title, url, observations, last_observed FROM items
+                    WHERE item_key IN ({','.join('?' * len(chunk))})
+                    """,
+                    chunk,
+                ).fetchall())
+            top.sort(key=lambda r: (r["observations"], r["last_observed"]), reverse=True)
+            top = top[:limit]
+            if not top:
+                return []
+
+        finally:
+            conn.close()
+        series = self.series([r["item_key"] for r in top], since=since)
+        return [
+            {"item": r["item_key"], "title": r["title"], "url": r["url"], "observations": r["observations"], "points": series.get(r["item_key"], [])}
+            for r in top
+        ]
+
+    def series(self, item_keys: List[str], since: str | None = None) -> Dict[str, List[dict]]:
+        """{item key: observations in time order} for the given items, a range read on (item, time) each."""
+        out: Dict[str, List[dict]] = {}
+        conn = get_conn()
+        try:
+            for chunk in chunks(list(item_keys)):
+                rows = conn.execute(
+                    f"""
+                    SELECT item_key, observed_at, price, site FROM price_observations
+                    WHERE item_key IN ({','.join('?' * len(chunk))}) AND observed_at >= ?
+                    ORDER BY item_key, observed_at
+                    """,
+                    chunk + [since or ""],
+                )
+                for r in rows:
+                    out.setdefault(r["item_key"], []).append({"date": r["observed_at"], "price": r["price"], "site": r["site"]})
+        finally:
+            conn.close()
+        return out
+
+    # internals
+    def _last_prices(self, conn, keys: List[str]) -> Dict[str, float]:
+        last, missing = self._last.get_many(keys)
+        found = []
+        for chunk in chunks(missing):
+            # sqlite takes the bare price column from the row with the MAX(observed_at)
+            found.extend((r[0], r[1]) for r in conn.execute(
+                f"""
+                SELECT listing_key, price, MAX(observed_at) FROM price_observations
+                WHERE listing_key IN ({','.join('?' * len(chunk))})
+                GROUP BY listing_key
+                """,
+                chunk,
+            ))
+        last.update(found)
+        self._last.put_many(found)
+        return last
+
+
+price_history = PriceHistory()
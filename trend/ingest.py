@@ -0,0 +1,235 @@
+#Saves fetched listings into the listings table so price history builds up
+import atexit
+import queue
+import threading
+from datetime import datetime
+from typing import Iterable, List, Tuple
+
+from .cache import normalize_query
+from .db import get_conn
+from .metrics import timed
+from .models import Listing
+
+BATCH_SIZE = 500
+# write-behind queue settings
+QUEUE_SIZE = 20000  # listings waiting to be written before we start dropping
+MAX_TXN_ROWS = 5000  # most rows the writer puts in one transaction
+FLUSH_INTERVAL = 1.0  # seconds the writer waits for more rows
+
+UPSERT_SQL = """
+    INSERT INTO listings (site, listing_id, title, price, currency, url, brand, size, condition, image_url, created_at, scraped_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (site, listing_id) DO UPDATE SET
+        title = excluded.title,
+        price = excluded.price,
+        currency = excluded.currency,
+        url = excluded.url,
+        brand = excluded.brand,
+        size = excluded.size,
+        condition = excluded.condition,
+        image_url = excluded.image_url,
+        created_at = COALESCE(excluded.created_at, listings.created_at),
+        scraped_at = excluded.scraped_at
+"""
+
+
+# daily rollup, a listing is counted once per query the first time we see it
+ROLLUP_BATCH_SQL = "INSERT INTO temp.rollup_batch (query_key, site, listing_id, day, price) VALUES (?, ?, ?, ?, ?)"
+ROLLUP_UPSERT_SQL = """
+    INSERT INTO price_daily (query_key, site, day, n, total, min_price, max_price, total_sq)
+    SELECT query_key, site, day, COUNT(*), SUM(price), MIN(price), MAX(price), SUM(price * price)
+    FROM (
+        SELECT query_key, site, listing_id, MIN(day) AS day, MIN(price) AS price
+        FROM temp.rollup_batch b
+        WHERE NOT EXISTS (
+            SELECT 1 FROM price_daily_members m
+            WHERE m.query_key = b.query_key AND m.site = b.site AND m.listing_id = b.listing_id
+        )
+        GROUP BY query_key, site, listing_id
+    )
+    WHERE true  -- needed: without a WHERE, sqlite parses ON CONFLICT as a join constraint of the SELECT
+    GROUP BY query_key, site, day
+    ON CONFLICT (query_key, site, day) DO UPDATE SET
+        n = n + excluded.n,
+        total = total + excluded.total,
+        min_price = MIN(min_price, excluded.min_price),
+        max_price = MAX(max_price, excluded.max_price),
+        total_sq = total_sq + excluded.total_sq
+"""
+ROLLUP_MEMBERS_SQL = """
+    INSERT OR IGNORE INTO price_daily_members (query_key, site, listing_id)
+    SELECT query_key, site, listing_id FROM temp.rollup_batch
+"""
+
+
+def _row(l: Listing, scraped_at: str) -> tuple:
+    created = l.created_at.isoformat() if l.created_at else None
+    return (l.site, l.listing_id, l.title, l.price, l.currency, l.url, l.brand, l.size, l.condition, l.image_url, created, scraped_at)
+
+
+def _update_rollup(conn, rollup_rows: List[tuple]) -> None:
+    """Add new (query, listing) pairs to price_daily, runs inside the caller's transaction."""
+    conn.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS rollup_batch (query_key TEXT, site TEXT, listing_id TEXT, day TEXT, price REAL)"
+    )
+    conn.execute("DELETE FROM temp.rollup_batch")
+    conn.executemany(ROLLUP_BATCH_SQL, rollup_rows)
+    conn.execute(ROLLUP_UPSERT_SQL)
+    conn.execute(ROLLUP_MEMBERS_SQL)
+
+
+def save_listings(listings: Iterable[Listing], query: str | None = None, batch_size: int = BATCH_SIZE) -> int:
+    """
+    Upsert listings on (site, listing_id), one transaction per batch.
+    scraped_at is refreshed to now for every listing we saw again.
+    If the query that found them is given the daily price rollup is updated too.
+    Returns how many rows were written.
+    """
+    key = normalize_query(query) if query else None
+    return _write([(key, l) for l in listings], batch_size)
+
+
+@timed("db_write_listings")
+def _write(items: List[Tuple[str | None, Listing]], batch_size: int) -> int:
+    """items are (normalized query or None, listing) pairs."""
+    now_dt = datetime.utcnow()
+    now = now_dt.isoformat()
+    written = 0
+
+    conn = get_conn()
+    try:
+        for i in range(0, len(items), batch_size):
+            rows = []
+            rollup_rows = []
+            for key, l in items[i:i + batch_size]:
+                # no id = nothing to key on
+                if not l.listing_id:
+                    continue
+                rows.append(_row(l, now))
+                if key and l.price and l.price > 0:
+                    day = (l.created_at or now_dt).date().isoformat()
+                    rollup_rows.append((key, l.site, l.listing_id, day, l.price))
+            if not rows:
+                continue
+
+            with conn:
+                conn.executemany(UPSERT_SQL, rows)
+                if rollup_rows:
+                    _update_rollup(conn, rollup_rows)
+            written += len(rows)
+    finally:
+        conn.close()
+    return written
+
+
+class IngestQueue:
+    """
+    Write-behind queue so request handlers don't wait on the disk.
+    Listings go into a bounded in-memory queue, one writer thread drains it
+    in big transactions. When the queue is full new listings are dropped and counted.
+    """
+
+    def __init__(self, maxsize=QUEUE_SIZE, max_txn_rows=MAX_TXN_ROWS, flush_interval=FLUSH_INTERVAL):
+        self.max_txn_rows = max_txn_rows
+        self.flush_interval = flush_interval
+        self._queue: queue.Queue = queue.Queue(maxsize)
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+        self.subscriber_errors = 0
+        self._subscribers = []
+
+    def subscribe(self, fn) -> None:
+        """fn(batch) is called on the writer thread with each written batch of (query key, listing) pairs."""
+        self._subscribers.append(fn)
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    def put(self, listings: Iterable[Listing], query: str | None = None) -> int:
+        """
+        Queue listings for writing, never blocks. Returns how many were accepted.
+        query is the search that found them, used for the daily price rollup.
+        """
+        self.start()
+        key = normalize_query(query) if query else None
+        accepted = dropped = 0
+        for l in listings:
+            try:
+                self._queue.put_nowait((key, l))
+                accepted += 1
+            except queue.Full:
+                dropped += 1
+        with self._lock:
+            self.enqueued += accepted
+            self.dropped += dropped
+        return accepted
+
+    def flush(self) -> None:
+        """Block until everything queued so far is written."""
+        self._queue.join()
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Shutdown hook: write what's left and stop the writer."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "errors": self.errors,
+            "subscriber_errors": self.subscriber_errors,
+        }
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                continue
+
+            batch = [first]
+            while len(batch) < self.max_txn_rows:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                _write(batch, self.max_txn_rows)
+                self.written += len(batch)
+                self.batches += 1
+            except Exception as e:
+                self.errors += 1
+                print("ingest writer failed:", e)
+            # one failing subscriber doesn't stop the others
+            for fn in self._subscribers:
+                try:
+                    fn(batch)
+                except Exception as e:
+                    self.subscriber_errors += 1
+                    print(f"ingest subscriber {getattr(fn, '__name__', fn)} failed:", e)
+            for _ in batch:
+                self._queue.task_done()
+
+
+ingest_queue = IngestQueue()
@@ -0,0 +1,38 @@
+#Bounded in-memory map kept in front of a table (dedupe clusters, seen listings, last prices)
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, List, Tuple
+
+
+class LRU:
+    """Thread safe key -> value map that drops the least recently used keys past `size`."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._lock = threading.Lock()
+        self._data: OrderedDict = OrderedDict()
+
+    def get_many(self, keys: Iterable[Hashable]) -> Tuple[Dict, List]:
+        """({key: value} for the keys held, keys that aren't), a hit counts as a use."""
+        found = {}
+        missing = []
+        with self._lock:
+            for k in keys:
+                v = self._data.get(k)
+                if v is None:
+                    missing.append(k)
+                else:
+                    self._data.move_to_end(k)
+                    found[k] = v
+        return found, missing
+
+    def put_many(self, pairs: Iterable[Tuple[Hashable, object]]) -> None:
+        with self._lock:
+            for k, v in pairs:
+                self._data[k] = v
+                self._data.move_to_end(k)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
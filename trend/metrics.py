@@ -0,0 +1,164 @@
+#Counters + latency histograms for the hot paths, rendered in the Prometheus text format on /metrics
+#(small in-house version, enough for what we export, no extra dependency)
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+# seconds, same as the prometheus client defaults
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_metrics: List["_Metric"] = []
+_gauge_callbacks: List[Tuple[str, str, Tuple[str, ...], Callable[[], Dict[tuple, float]]]] = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def _key(self, values) -> tuple:
+        if len(values) != len(self.labels):
+            raise ValueError(f"{self.name} needs labels {self.labels}")
+        return tuple(str(v) for v in values)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1) -> None:
+        key = self._key(label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *label_values) -> float:
+        with self._lock:
+            return self._values.get(self._key(label_values), 0)
+
+    def _samples(self):
+        with self._lock:
+            return [f"{self.name}{_labels(self.labels, k)} {_num(v)}" for k, v in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series: Dict[tuple, list] = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, *label_values) -> None:
+        key = self._key(label_values)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            # counts are per bucket here, made cumulative when rendered
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    s[i] += 1
+                    break
+            s[-2] += value
+            s[-1] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def _samples(self):
+        lines = []
+        with self._lock:
+            for key, s in sorted(self._series.items()):
+                running = 0
+                for i, bound in enumerate(self.buckets):
+                    running += s[i]
+                    le = 'le="%s"' % _num(bound)
+                    lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {running}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_num(s[-2])}")
+                lines.append(f"{self.name}_count{_labels(self.labels, key)} {s[-1]}")
+        return lines
+
+
+def gauge_callback(name: str, help: str, fn: Callable[[], Dict[tuple, float]], labels: Tuple[str, ...] = ()) -> None:
+    """
+    A gauge read at scrape time: fn() returns {label values tuple: value}
+    (use () as the key for a gauge without labels).
+    """
+    _gauge_callbacks.append((name, help, tuple(labels), fn))
+
+
+def render() -> str:
+    lines = []
+    for m in list(_metrics):
+        lines.extend(m.render())
+    for name, help, labels, fn in list(_gauge_callbacks):
+        try:
+            values = fn()
+        except Exception as e:
+            print(f"metrics gauge {name} failed:", e)
+            continue
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.extend(f"{name}{_labels(labels, k)} {_num(v)}" for k, v in values.items())
+    return "\n".join(lines) + "\n"
+
+
+# the metrics the app records
+STAGE_SECONDS = Histogram("trend_stage_seconds", "Time spent in a pipeline stage (filters, stats, db calls).", ("stage",))
+CLIENT_SECONDS = Histogram("trend_client_call_seconds", "Upstream marketplace calls (search/search_page).", ("site", "method"))
+CLIENT_ERRORS = Counter("trend_client_errors_total", "Upstream marketplace calls that raised.", ("site",))
+CLIENT_RETRIES = Counter("trend_client_retries_total", "Upstream calls retried after an error.", ("site",))
+CLIENT_REJECTED = Counter("trend_client_rejected_total", "Calls not sent upstream (rate limit or open circuit).", ("site", "reason"))
+SITE_SECONDS = Histogram("trend_site_search_seconds", "Per-site search time in a fan-out (cache included).", ("site",))
+SITE_SEARCHES = Counter("trend_site_searches_total", "Per-site fan-out searches by outcome (ok/timeout/error).", ("site", "outcome"))
+TEMPLATE_SECONDS = Histogram("trend_template_render_seconds", "Jinja template render time.", ("template",))
+REQUEST_SECONDS = Histogram("trend_http_request_seconds", "Flask request handling time.", ("endpoint", "method", "status"))
+
+
+def timed(stage: str):
+    """Decorator, records each call's duration under trend_stage_seconds{stage=...}."""
+
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with STAGE_SECONDS.time(stage):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
@@ -0,0 +1,120 @@
+#Matches listings against all watch rules at once (reverse search): the rules are indexed, not the listings
+import re
+from collections import defaultdict
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from .cache import normalize_query
+from .filters import compile_filter
+from .metrics import timed
+from .models import Listing
+
+_WORD = re.compile(r"[^\W_]+")
+MAX_PREFIX = 24  # longer words only get their first 24 prefixes indexed/looked up
+
+
+def words(text: str) -> List[str]:
+    return _WORD.findall((text or "").lower())
+
+
+@lru_cache(maxsize=65536)
+def listing_prefixes(title: str, brand: str) -> frozenset:
+    """Every prefix of every title/brand word, a query word matches if it's one of them ('jack' -> 'jacket')."""
+    out = set()
+    for w in words(title) + words(brand):
+        for i in range(1, min(len(w), MAX_PREFIX) + 1):
+            out.add(w[:i])
+    return frozenset(out)
+
+
+class RulePercolator:
+    """
+    Inverted index over watch rules, so each listing is looked up once instead of checked rule by rule.
+
+    A listing satisfies a rule's query when every query word is a prefix of one of its title/brand words,
+    or when it was found by searching exactly that query (the marketplace already matched it).
+    Rules are indexed per site under their longest query word and under their normalized query,
+    so a listing only reaches the rules that can match it. Tags and max price are then checked
+    on those few candidates with the rule's compiled filter.
+    """
+
+    def __init__(self, rules: List[dict] = (), snapshot: Callable[[], Tuple[int, List[dict]]] | None = None):
+        """
+        Index the given rules, or follow a rule store: snapshot() returns (version, rules)
+        and the index is (re)built on refresh() whenever the version changed, call it before matching.
+        """
+        self._snapshot = snapshot
+        self._version = None
+        self._build(list(rules))
+
+    def refresh(self) -> None:
+        if self._snapshot is None:
+            return
+        version, rules = self._snapshot()
+        if version != self._version:
+            self._build(rules)
+            self._version = version
+
+    def _build(self, rules: List[dict]) -> None:
+        # rules with the same site, query and filter match exactly the same listings, they're checked once
+        groups: Dict[tuple, List[dict]] = defaultdict(list)
+        for rule in rules:
+            flt = compile_filter(tuple(rule["tags"] or ()), rule["max_price"])
+            for site in rule["sites"]:
+                groups[(site, normalize_query(rule["query"]), flt)].append(rule)
+
+        index = defaultdict(list)  # (site, word) or (site, "=" + normalized query) -> [(terms, filter, rules)]
+        for (site, query_key, flt), members in groups.items():
+            terms = tuple(dict.fromkeys(t[:MAX_PREFIX] for t in words(query_key)))
+            entry = (terms, flt, members)
+            # longest query word is usually the rarest one
+            index[(site, max(terms, key=len) if terms else "")].append(entry)
+            index[(site, "=" + query_key)].append(entry)
+        # swapped in one go, readers see either the old or the new index
+        self._index = dict(index)
+
+    def match(self, l: Listing, query_key: str | None = None) -> List[dict]:
+        """Rules this listing satisfies. query_key = normalized query of the search that found it."""
+        index = self._index
+        prefixes = listing_prefixes(l.title or "", l.brand or "")
+
+        candidates = []
+        if query_key is not None:
+            candidates.extend((entry, True) for entry in index.get((l.site, "=" + query_key), ()))
+        for p in prefixes:
+            bucket = index.get((l.site, p))
+            if bucket:
+                candidates.extend((entry, False) for entry in bucket)
+        # rules without any query words, only tags/price decide
+        candidates.extend((entry, False) for entry in index.get((l.site, ""), ()))
+
+        out = []
+        done = set()
+        filter_result = {}  # many groups share a filter (same tags/price), run it once per listing
+        for entry, exact in candidates:
+            if id(entry) in done:
+                continue
+            terms, flt, members = entry
+            if not exact and not all(t in prefixes for t in terms):
+                continue
+            done.add(id(entry))
+            ok = filter_result.get(flt)
+            if ok is None:
+                ok = filter_result[flt] = flt.matches(l)
+            if ok:
+                out.extend(members)
+        return out
+
+    @timed("percolate")
+    def match_many(self, items: Iterable[Tuple[str | None, Listing]]) -> Dict[int, List[Listing]]:
+        """(query key, listing) pairs -> {rule id: matching listings}, each listing once per rule."""
+        matches: Dict[int, List[Listing]] = defaultdict(list)
+        seen = set()
+        for query_key, l in items:
+            for rule in self.match(l, query_key):
+                k = (rule["id"], l.site, l.listing_id)
+                if l.listing_id and k in seen:
+                    continue
+                seen.add(k)
+                matches[rule["id"]].append(l)
+        return dict(matches)
@@ -0,0 +1,57 @@
+#Decides which filters each marketplace applies upstream (pushdown) so we fetch less we'd throw away
+from typing import Dict, Iterable, List
+
+from .api_clients import site_info
+
+PUSHABLE = ("min_price", "max_price", "size", "brand")
+
+
+def predicates(max_price: float | None = None, min_price: float | None = None, size: str | None = None, brand: str | None = None) -> dict:
+    """The pushable part of a rule/search, unset ones left out."""
+    given = {"min_price": min_price, "max_price": max_price, "size": size, "brand": brand}
+    return {k: v for k, v in given.items() if v is not None}
+
+
+def rule_predicates(rule: dict) -> dict:
+    # rules only have a max price for now, tags can't be expressed as an upstream filter
+    return predicates(max_price=rule.get("max_price"))
+
+
+def merge(preds: List[dict]) -> dict:
+    """
+    One upstream filter that keeps everything any of the searches sharing the fetch wants:
+    loosest price bound, brand/size only when they all ask for the same one.
+    A predicate one search doesn't have can't be pushed at all.
+    """
+    if not preds:
+        return {}
+    merged = {}
+    for name in PUSHABLE:
+        values = [p.get(name) for p in preds]
+        if any(v is None for v in values):
+            continue
+        if name == "max_price":
+            merged[name] = max(values)
+        elif name == "min_price":
+            merged[name] = min(values)
+        elif len(set(values)) == 1:
+            merged[name] = values[0]
+    return merged
+
+
+def plan_pushdown(sites: Iterable[str], wants: Iterable[tuple]) -> Dict[str, dict]:
+    """
+    wants: (sites, predicates) per rule/search sharing one query.
+    Returns {site: search() kwargs} with only what that site can filter (its registry capabilities),
+    everything else is left to the local filters. Local filters still run on the results,
+    so a loose upstream filter (whole dollars etc) never lets a wrong listing through.
+    """
+    wants = list(wants)
+    plan = {}
+    for site in sites:
+        merged = merge([p for wanted_by, p in wants if site in wanted_by])
+        # from the registry, so planning doesn't build the client
+        info = site_info(site)
+        caps = info.capabilities if info else frozenset()
+        plan[site] = {k: v for k, v in merged.items() if k in caps}
+    return plan
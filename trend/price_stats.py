@@ -1,19 +1,119 @@
+import math
+import re
+from datetime import date
+
+from .cache import normalize_query
 from .db import get_conn
+from .metrics import timed
+
 
+def fts_query(query: str) -> str | None:
+    """
+    Turn a user query into an FTS5 MATCH expression.
+    Every word has to appear (as a prefix, so 'jack' still finds 'jacket') in title or brand.
+    """
+    words = re.findall(r"\w+", (query or "").lower())
+    if not words:
+        return None
+    return " ".join(f'"{w}"*' for w in words)
 
 
 #average price calculator from DB using key words
+@timed("db_average_price")
 def average_price_for_query(query: str):
+    # the daily rollup answers in one small range read when we've tracked this query before
+    avg = rollup_average(query)
+    if avg is not None:
+        return avg
+
+    match = fts_query(query)
+    if match is None:
+        return None
+
     conn = get_conn()
     c = conn.cursor()
 
+    # goes through the fts index instead of scanning every title with LIKE
     c.execute("""
-        SELECT AVG(price) AS avg_price
-        FROM listings
-        WHERE title LIKE ?
-    """, (f"%{query}%",))
+        SELECT AVG(l.price) AS avg_price
+        FROM listings_fts
+        JOIN listings l ON l.id = listings_fts.rowid
+        WHERE listings_fts MATCH ?
+    """, (match,))
 
     row = c.fetchone()
     conn.close()
 
-    return row["avg_price"] if row and row["avg_price"] is not None else None#Needs to be optimized in the future not optimal for large scales
+    return row["avg_price"] if row and row["avg_price"] is not None else None
+
+
+def rollup_average(query: str):
+    """Average price of everything ever ingested for this query, from the daily rollup."""
+    conn = get_conn()
+    row = conn.execute(
+        "SELECT SUM(total) AS total, SUM(n) AS n FROM price_daily WHERE query_key = ?",
+        (normalize_query(query),),
+    ).fetchone()
+    conn.close()
+    if not row or not row["n"]:
+        return None
+    return row["total"] / row["n"]
+
+
+@timed("db_daily_prices")
+def daily_prices(query: str, site: str | None = None) -> list[dict]:
+    """
+    One point per day for a query (all sites combined, or one site).
+    Each point has count, avg, min, max and std dev of the prices first seen that day.
+    """
+    sql = """
+        SELECT day, SUM(n) AS n, SUM(total) AS total, MIN(min_price) AS min_price,
+               MAX(max_price) AS max_price, SUM(total_sq) AS total_sq
+        FROM price_daily
+        WHERE query_key = ?
+    """
+    params = [normalize_query(query)]
+    if site:
+        sql += " AND site = ?"
+        params.append(site)
+    sql += " GROUP BY day ORDER BY day"
+
+    conn = get_conn()
+    rows = conn.execute(sql, params).fetchall()
+    conn.close()
+
+    points = []
+    for r in rows:
+        n = r["n"]
+        avg = r["total"] / n
+        variance = max(r["total_sq"] / n - avg * avg, 0.0)
+        points.append({
+            "date": r["day"],
+            "count": n,
+            "avg": round(avg, 2),
+            "min": r["min_price"],
+            "max": r["max_price"],
+            "std": round(math.sqrt(variance), 2),
+        })
+    return points
+
+
+def weekly_price_change(points: list[dict]):
+    """
+    Average price change per week, the count weighted least squares slope over daily_prices() points.
+    None if there's less than two different days.
+    """
+    if len(points) < 2:
+        return None
+
+    xs = [date.fromisoformat(p["date"]).toordinal() for p in points]
+    ws = [p["count"] for p in points]
+    ys = [p["avg"] for p in points]
+    w_total = sum(ws)
+    x_mean = sum(w * x for w, x in zip(ws, xs)) / w_total
+    y_mean = sum(w * y for w, y in zip(ws, ys)) / w_total
+    var_x = sum(w * (x - x_mean) ** 2 for w, x in zip(ws, xs))
+    if var_x == 0:
+        return None
+    cov = sum(w * (x - x_mean) * (y - y_mean) for w, x, y in zip(ws, xs, ys))
+    return round(cov / var_x * 7, 2)
@@ -0,0 +1,206 @@
+#Latest watch rule results and undelivered new items, stored in SQLite so every worker process sees them
+import json
+import random
+import threading
+import time
+from dataclasses import fields
+from datetime import datetime
+from typing import Dict, List
+
+from .db import get_conn
+from .models import Listing
+
+MAX_NEW_ITEMS = 500  # undelivered new items kept per rule, oldest go first
+SCHEDULER_LEASE = "rule_scheduler"
+
+_FIELDS = [f.name for f in fields(Listing)]
+_DATES = {"created_at", "scraped_at"}
+
+
+def dump_listings(listings: List[Listing]) -> str:
+    """Compact JSON, one array of field values per listing."""
+    return json.dumps([
+        [v.isoformat() if k in _DATES and v is not None else v for k, v in zip(_FIELDS, (getattr(l, f) for f in _FIELDS))]
+        for l in listings
+    ])
+
+
+def load_listings(text: str) -> List[Listing]:
+    out = []
+    for values in json.loads(text or "[]"):
+        kw = dict(zip(_FIELDS, values))
+        for k in _DATES:
+            if kw.get(k):
+                kw[k] = datetime.fromisoformat(kw[k])
+        out.append(Listing(**kw))
+    return out
+
+
+class RuleStateStore:
+    """
+    The rule_state / rule_new_items tables, plus the lease that picks the one process running the scheduler.
+
+    A state is {"rule", "matches", "updated_at", "error", "version"}, updated_at is None until a run succeeded.
+    Decoded matches are cached per rule and reused while the row's version is unchanged.
+    New items are handed out once: the worker whose DELETE returns them shows them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache: Dict[int, dict] = {}  # rule id -> last decoded state
+
+    def get(self, rule_id: int) -> dict | None:
+        conn = get_conn()
+        try:
+            row = conn.execute("SELECT version FROM rule_state WHERE rule_id = ?", (rule_id,)).fetchone()
+            if row is None:
+                return None
+            with self._lock:
+                st = self._cache.get(rule_id)
+            if st is not None and st["version"] == row[0]:
+                return st
+            row = conn.execute("SELECT * FROM rule_state WHERE rule_id = ?", (rule_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        st = {
+            "rule": json.loads(row["rule"]),
+            "matches": load_listings(row["matches"]),
+            "updated_at": datetime.fromisoformat(row["updated_at"]) if row["updated_at"] else None,
+            "error": row["error"],
+            "version": row["version"],
+        }
+        with self._lock:
+            self._cache[rule_id] = st
+        return st
+
+    def states(self) -> Dict[int, dict]:
+        """{rule id: {"rule", "updated_at"}} for every stored state, without decoding the matches."""
+        conn = get_conn()
+        try:
+            rows = conn.execute("SELECT rule_id, rule, updated_at FROM rule_state").fetchall()
+        finally:
+            conn.close()
+        return {
+            r["rule_id"]: {"rule": json.loads(r["rule"]), "updated_at": datetime.fromisoformat(r["updated_at"]) if r["updated_at"] else None}
+            for r in rows
+        }
+
+    def save(self, rule: dict, matches: List[Listing] | None, new_items: List[Listing], error: str | None) -> None:
+        """Result of a run, matches None = it failed and the previous matches stay."""
+        version = random.getrandbits(62)
+        conn = get_conn()
+        try:
+            with conn:
+                if matches is None:
+                    conn.execute(
+                        """
+                        INSERT INTO rule_state (rule_id, rule, error, version) VALUES (?, ?, ?, ?)
+                        ON CONFLICT (rule_id) DO UPDATE SET rule = excluded.rule, error = excluded.error, version = excluded.version
+                        """,
+                        (rule["id"], json.dumps(rule), error, version),
+                    )
+                else:
+                    conn.execute(
+                        """
+                        INSERT OR REPLACE INTO rule_state (rule_id, rule, matches, updated_at, error, version)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        """,
+                        (rule["id"], json.dumps(rule), dump_listings(matches), datetime.utcnow().isoformat(), error, version),
+                    )
+                self._add_new_items(conn, rule["id"], new_items)
+        finally:
+            conn.close()
+
+    def replace_matches(self, rule_id: int, matches: List[Listing], version: int) -> bool:
+        """Swap in new matches unless the state changed since `version` was read (e.g. a run finished)."""
+        conn = get_conn()
+        try:
+            with conn:
+                cur = conn.execute(
+                    "UPDATE rule_state SET matches = ?, version = ? WHERE rule_id = ? AND version = ?",
+                    (dump_listings(matches), random.getrandbits(62), rule_id, version),
+                )
+        finally:
+            conn.close()
+        return cur.rowcount == 1
+
+    def add_new_items(self, rule_id: int, items: List[Listing]) -> None:
+        conn = get_conn()
+        try:
+            with conn:
+                self._add_new_items(conn, rule_id, items)
+        finally:
+            conn.close()
+
+    def take_new_items(self, rule_id: int) -> List[Listing]:
+        """New items found since anyone last took them, in the order they were found."""
+        conn = get_conn()
+        try:
+            with conn:
+                rows = conn.execute("DELETE FROM rule_new_items WHERE rule_id = ? RETURNING id, listing", (rule_id,)).fetchall()
+        finally:
+            conn.close()
+        rows.sort(key=lambda r: r[0])
+        return load_listings("[" + ",".join(r[1] for r in rows) + "]")
+
+    def clear(self, rule_id: int) -> None:
+        """Forget a rule's matches and pending new items (the rule changed)."""
+        conn = get_conn()
+        try:
+            with conn:
+                conn.execute("DELETE FROM rule_state WHERE rule_id = ?", (rule_id,))
+                conn.execute("DELETE FROM rule_new_items WHERE rule_id = ?", (rule_id,))
+        finally:
+            conn.close()
+        with self._lock:
+            self._cache.pop(rule_id, None)
+
+    def acquire_lease(self, owner: str, seconds: float, name: str = SCHEDULER_LEASE) -> bool:
+        """Take or renew a lease, True while `owner` holds it. It lapses if not renewed within `seconds`."""
+        now = time.time()
+        conn = get_conn()
+        try:
+            with conn:
+                conn.execute(
+                    """
+                    INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)
+                    ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                    WHERE leases.owner = excluded.owner OR leases.expires_at < ?
+                    """,
+                    (name, owner, now + seconds, now),
+                )
+                row = conn.execute("SELECT owner FROM leases WHERE name = ?", (name,)).fetchone()
+        finally:
+            conn.close()
+        return row is not None and row[0] == owner
+
+    def release_lease(self, owner: str, name: str = SCHEDULER_LEASE) -> None:
+        conn = get_conn()
+        try:
+            with conn:
+                conn.execute("UPDATE leases SET expires_at = 0 WHERE name = ? AND owner = ?", (name, owner))
+        finally:
+            conn.close()
+
+    # internals
+    @staticmethod
+    def _add_new_items(conn, rule_id: int, items: List[Listing]) -> None:
+        if not items:
+            return
+        conn.executemany(
+            "INSERT INTO rule_new_items (rule_id, listing) VALUES (?, ?)",
+            [(rule_id, dump_listings([l])[1:-1]) for l in items],
+        )
+        conn.execute(
+            """
+            DELETE FROM rule_new_items WHERE rule_id = ? AND id NOT IN (
+                SELECT id FROM rule_new_items WHERE rule_id = ? ORDER BY id DESC LIMIT ?
+            )
+            """,
+            (rule_id, rule_id, MAX_NEW_ITEMS),
+        )
+
+
+rule_state_store = RuleStateStore()
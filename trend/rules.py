@@ -0,0 +1,110 @@
+#Watch rules stored in SQLite so every worker process sees the same rules
+import json
+import threading
+from datetime import datetime
+from typing import List, Tuple
+
+from .db import get_conn
+
+VERSION_KEY = "watch_rules_version"
+
+
+def _rule_from_row(row) -> dict:
+    return {
+        "id": row["id"],
+        "query": row["query"],
+        "tags": json.loads(row["tags"] or "[]"),
+        "max_price": row["max_price"],
+        "sites": json.loads(row["sites"] or "[]"),
+        "interval": row["interval"],
+    }
+
+
+class RuleStore:
+    """
+    Reads/writes the watch_rules table.
+    Keeps the rules cached in memory and only reloads when the version counter
+    in the meta table changed (every write bumps it in the same transaction).
+    Rule dicts handed out are shared, change rules through update() only.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._rules: List[dict] = []
+
+    def all(self) -> List[dict]:
+        return self.snapshot()[1]
+
+    def snapshot(self) -> Tuple[int, List[dict]]:
+        """(version, rules), the version changes whenever any rule was added or edited."""
+        conn = get_conn()
+        try:
+            version = self._read_version(conn)
+            with self._lock:
+                if version != self._version:
+                    rows = conn.execute("SELECT * FROM watch_rules ORDER BY id").fetchall()
+                    self._rules = [_rule_from_row(r) for r in rows]
+                    self._version = version
+                return version, list(self._rules)
+        finally:
+            conn.close()
+
+    def get(self, rule_id: int) -> dict | None:
+        return next((r for r in self.all() if r["id"] == rule_id), None)
+
+    def add(self, query: str, tags: List[str], max_price: float | None, sites: List[str]) -> dict:
+        """Insert a rule, the id comes from the table so workers never hand out the same one."""
+        conn = get_conn()
+        try:
+            with conn:
+                # take the write lock up front so id + version bump happen together
+                conn.execute("BEGIN IMMEDIATE")
+                cur = conn.execute(
+                    "INSERT INTO watch_rules (query, tags, max_price, sites, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (query, json.dumps(tags), max_price, json.dumps(sites), datetime.utcnow().isoformat()),
+                )
+                rule_id = cur.lastrowid
+                self._bump_version(conn)
+        finally:
+            conn.close()
+        return self.get(rule_id)
+
+    def update(self, rule_id: int, **fields) -> dict | None:
+        """Change query/tags/max_price/sites/interval of a rule."""
+        allowed = {"query", "tags", "max_price", "sites", "interval"}
+        sets, params = [], []
+        for name, value in fields.items():
+            if name not in allowed:
+                raise ValueError(f"unknown rule field {name}")
+            if name in ("tags", "sites"):
+                value = json.dumps(value)
+            sets.append(f"{name} = ?")
+            params.append(value)
+        if not sets:
+            return self.get(rule_id)
+
+        conn = get_conn()
+        try:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute(f"UPDATE watch_rules SET {', '.join(sets)} WHERE id = ?", (*params, rule_id))
+                self._bump_version(conn)
+        finally:
+            conn.close()
+        return self.get(rule_id)
+
+    def count(self) -> int:
+        return len(self.all())
+
+    @staticmethod
+    def _read_version(conn) -> int:
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (VERSION_KEY,)).fetchone()
+        return row[0] if row else 0
+
+    @staticmethod
+    def _bump_version(conn) -> None:
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = ?", (VERSION_KEY,))
+
+
+rule_store = RuleStore()
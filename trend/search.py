@@ -0,0 +1,152 @@
+#Runs the marketplace searches at the same time instead of one after another
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from itertools import islice
+from typing import Callable, Dict, Iterator, List, Mapping, NamedTuple
+
+from .api_clients.base import BaseMarketplaceClient, run_blocking, submit
+from .cache import acached_search
+from .metrics import SITE_SEARCHES, SITE_SECONDS
+
+# seconds each site gets before we stop waiting for it
+DEFAULT_TIMEOUT = 8.0
+SITE_TIMEOUTS = {
+    "grailed": 10.0,
+    "mercari_us": 5.0,
+    "depop": 5.0,
+    "poshmark": 5.0,
+    "facebook_marketplace": 5.0,
+}
+
+# most pages a filtered (streaming) search reads per site
+MAX_STREAM_PAGES = 3
+
+
+class SearchResults(list):
+    """
+    List of listings from a fan-out search.
+    Also remembers which sites timed out or failed so the page can say so.
+    """
+
+    def __init__(self, items=(), timed_out=None, failed=None):
+        super().__init__(items)
+        self.timed_out: List[str] = timed_out or []
+        self.failed: Dict[str, str] = failed or {}
+
+    @property
+    def partial(self) -> bool:
+        return bool(self.timed_out or self.failed)
+
+    @property
+    def missing_sites(self) -> List[str]:
+        return self.timed_out + list(self.failed)
+
+
+def stream_search(client: BaseMarketplaceClient, query: str, limit: int, keep: Callable, **filters) -> list:
+    """
+    Pages through the site until `limit` listings pass keep(), or MAX_STREAM_PAGES pages were read.
+    Only the kept listings are returned.
+    """
+    listings = client.iter_search(query, page_size=limit, max_items=limit * MAX_STREAM_PAGES, **filters)
+    return list(islice((l for l in listings if keep(l)), limit))
+
+
+async def asearch_site(clients: Mapping[str, BaseMarketplaceClient], site: str, query: str, limit: int, keep: Callable | None, **filters) -> list:
+    """
+    One site's part of a fan-out, runs on the shared event loop.
+    The client is looked up (built on first use, that may import its SDK) here, off the loop.
+    """
+    client = await run_blocking(clients.__getitem__, site)
+    if keep is None:
+        # repeated queries are answered from the result cache
+        return await acached_search(client, query, limit=limit, **filters)
+    # paging until enough listings pass keep() only exists as blocking iter_search()
+    return await run_blocking(stream_search, client, query, limit, keep, **filters)
+
+
+class SiteResult(NamedTuple):
+    """What one site came back with, listings is None when it timed out or failed."""
+    site: str
+    listings: list | None
+    timed_out: bool = False
+    error: str | None = None
+
+
+def iter_fan_out(
+    clients: Mapping[str, BaseMarketplaceClient],
+    query: str,
+    limit: int = 20,
+    timeouts: Dict[str, float] | None = None,
+    keep: Callable | None = None,
+    filters: Dict[str, dict] | None = None,
+) -> Iterator[SiteResult]:
+    """
+    Search every client at once (client.asearch() on the shared event loop) and yield each site's
+    SiteResult as soon as it's in, fastest site first. Sites that miss their deadline are yielded as timed out.
+    With keep given each site streams pages until it has `limit` listings passing it.
+    filters: extra search() kwargs per site (pushed down filters, see planner.py)
+    """
+    timeouts = timeouts or SITE_TIMEOUTS
+    filters = filters or {}
+    start = time.monotonic()
+
+    futures = {}
+    for site in clients:
+        fut = submit(asearch_site(clients, site, query, limit, keep, **filters.get(site, {})))
+        futures[fut] = site
+
+    # deadlines are counted from the start so total wait = slowest deadline, not the sum
+    deadlines = {fut: start + timeouts.get(site, DEFAULT_TIMEOUT) for fut, site in futures.items()}
+    pending = set(futures)
+    while pending:
+        wait_for = max(0.0, min(deadlines[f] for f in pending) - time.monotonic())
+        done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+        for fut in done:
+            site = futures[fut]
+            try:
+                listings = fut.result()
+            except Exception as e:
+                print(f"{site} search failed:", e)
+                SITE_SEARCHES.inc(site, "error")
+                yield SiteResult(site, None, error=str(e))
+            else:
+                SITE_SECONDS.observe(time.monotonic() - start, site)
+                SITE_SEARCHES.inc(site, "ok")
+                yield SiteResult(site, listings)
+
+        now = time.monotonic()
+        for fut in [f for f in pending if deadlines[f] <= now]:
+            pending.discard(fut)
+            fut.cancel()
+            site = futures[fut]
+            print(f"{site} search timed out after {timeouts.get(site, DEFAULT_TIMEOUT)}s")
+            SITE_SEARCHES.inc(site, "timeout")
+            yield SiteResult(site, None, timed_out=True)
+
+
+def fan_out(
+    clients: Mapping[str, BaseMarketplaceClient],
+    query: str,
+    limit: int = 20,
+    timeouts: Dict[str, float] | None = None,
+    keep: Callable | None = None,
+    filters: Dict[str, dict] | None = None,
+) -> SearchResults:
+    """
+    Search every client in parallel, each site has its own deadline.
+    Whatever came back in time is returned, the rest is marked as timed out/failed.
+    Results are in client order, not arrival order.
+    """
+    by_site = {r.site: r for r in iter_fan_out(clients, query, limit=limit, timeouts=timeouts, keep=keep, filters=filters)}
+
+    results = SearchResults()
+    for site in clients:
+        r = by_site[site]
+        if r.timed_out:
+            results.timed_out.append(site)
+        elif r.error is not None:
+            results.failed[site] = r.error
+        else:
+            results.extend(r.listings)
+    return results
+
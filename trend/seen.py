@@ -0,0 +1,118 @@
+#Remembers which listings each watch rule has already reported, survives restarts
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List
+
+from .db import get_conn
+from .dedupe import duplicate_index
+from .lru import LRU
+from .metrics import timed
+from .models import Listing, listing_key
+
+SEEN_TTL_DAYS = 30  # a listing not seen again for this long is forgotten
+LRU_SIZE = 100_000  # (rule, listing) pairs kept in memory in front of the table
+EXPIRE_EVERY = 3600.0  # seconds between clean ups of old rows
+
+
+class SeenIndex:
+    """
+    Per-rule seen listings stored in the seen_listings table.
+
+    A bounded LRU in memory answers "already seen" for the common case without touching the DB.
+    Only listings missing from it are checked in SQLite, and a listing only counts as new
+    for the process whose INSERT actually added the row, so several workers don't double notify.
+    Rows whose last_seen is older than the TTL are deleted, memory entries expire the same way.
+
+    keys(items) gives the key each listing is remembered under, by default its own site:id.
+    With duplicate_index.keys (stored) it's the item's cluster, so a cross-post of something already
+    reported doesn't count as new.
+    """
+
+    def __init__(self, ttl_days: float = SEEN_TTL_DAYS, lru_size: int = LRU_SIZE, keys: Callable[[List[Listing]], List[str]] | None = None):
+        self.ttl = ttl_days * 86400
+        self.keys = keys or (lambda items: [listing_key(l) for l in items])
+        self._lru = LRU(lru_size)  # (rule_id, key) -> monotonic time we last confirmed it in the DB
+        self._last_expire = None
+
+    @timed("db_seen_filter")
+    def filter_new(self, rule_id: int, items: List[Listing]) -> List[Listing]:
+        """Returns the items this rule hasn't seen before and marks everything as seen."""
+        now = time.monotonic()
+        # refresh last_seen in the DB at most this often per listing
+        refresh_after = self.ttl / 4
+
+        unknown = {}
+        stale = []
+        by_key = {}
+        for l, key in zip(items, self.keys(items)):
+            if l.listing_id and key:
+                by_key.setdefault(key, l)
+        confirmed, _ = self._lru.get_many((rule_id, key) for key in by_key)
+        for key, l in by_key.items():
+            at = confirmed.get((rule_id, key))
+            if at is None or now - at > self.ttl:
+                unknown[key] = l
+            elif now - at > refresh_after:
+                stale.append(key)
+
+        if not unknown and not stale:
+            return []
+
+        stamp = datetime.utcnow().isoformat()
+        new_items = []
+        conn = get_conn()
+        try:
+            with conn:
+                for key, l in unknown.items():
+                    cur = conn.execute(
+                        """
+                        INSERT INTO seen_listings (rule_id, listing_key, first_seen, last_seen) VALUES (?, ?, ?, ?)
+                        ON CONFLICT (rule_id, listing_key) DO NOTHING
+                        """,
+                        (rule_id, key, stamp, stamp),
+                    )
+                    if cur.rowcount == 1:
+                        new_items.append(l)
+                    else:
+                        stale.append(key)
+                if stale:
+                    conn.executemany(
+                        "UPDATE seen_listings SET last_seen = ? WHERE rule_id = ? AND listing_key = ?",
+                        [(stamp, rule_id, key) for key in stale],
+                    )
+        finally:
+            conn.close()
+
+        self._lru.put_many(((rule_id, key), now) for key in list(unknown) + stale)
+
+        if self._last_expire is None or now - self._last_expire > EXPIRE_EVERY:
+            self.expire()
+        return new_items
+
+    def expire(self) -> int:
+        """Delete rows not seen within the TTL, returns how many went."""
+        self._last_expire = time.monotonic()
+        cutoff = (datetime.utcnow() - timedelta(seconds=self.ttl)).isoformat()
+        conn = get_conn()
+        try:
+            with conn:
+                deleted = conn.execute("DELETE FROM seen_listings WHERE last_seen < ?", (cutoff,)).rowcount
+        finally:
+            conn.close()
+        return deleted
+
+    def count(self, rule_id: int | None = None) -> int:
+        conn = get_conn()
+        try:
+            if rule_id is None:
+                row = conn.execute("SELECT COUNT(*) FROM seen_listings").fetchone()
+            else:
+                row = conn.execute("SELECT COUNT(*) FROM seen_listings WHERE rule_id = ?", (rule_id,)).fetchone()
+        finally:
+            conn.close()
+        return row[0]
+
+
+# cluster keys for lone listings are their own site:id, so rows from before still match.
+# They're stored before a row is keyed on them, a cluster that changed later would notify twice
+seen_index = SeenIndex(keys=lambda items: duplicate_index.keys(items, store=True))
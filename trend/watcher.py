@@ -0,0 +1,234 @@
+#Evaluates watch rules in the background so /watch only has to read the latest state
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from .cache import normalize_query
+from .dedupe import duplicate_index
+from .models import Listing
+from .rule_state import RuleStateStore
+from .seen import SeenIndex
+
+DEFAULT_INTERVAL = 300.0  # seconds between checks of a rule, a rule can set its own "interval"
+JITTER = 0.1  # +-10% so rules added together don't all fire at the same moment
+MAX_CONCURRENT = 4  # query groups evaluated at the same time, across all rules
+TICK = 1.0  # how often the scheduler looks for due rules
+MAX_MATCHES = 500  # matches kept per rule when percolated hits are added between runs
+LEASE_SECONDS = 30.0  # the scheduling process must renew its lease within this, or another one takes over
+LEASE_RENEW = 10.0  # how often the lease is renewed / tried for
+
+
+def group_key(rule: dict) -> str:
+    """Rules with the same normalized query share one upstream fetch."""
+    return normalize_query(rule["query"])
+
+
+class RuleScheduler:
+    """
+    Background loop that re-runs each watch rule on its own interval.
+    The latest matches per rule and the new items nobody was shown yet are kept in the store (SQLite),
+    so every worker process reads the same state. Only the process holding the scheduler lease runs
+    rules, the others just read, and one of them takes over if the lease isn't renewed.
+
+    get_rules() returns the current rule dicts.
+    evaluate(rules) gets rules sharing a query and returns {rule id: matches}.
+    When one rule of a group is due the whole group runs, since the fetch is shared anyway.
+    seen decides which matches are new for a rule.
+    """
+
+    def __init__(
+        self,
+        get_rules: Callable[[], List[dict]],
+        evaluate: Callable[[List[dict]], Dict[int, List[Listing]]],
+        seen: SeenIndex,
+        store: RuleStateStore,
+        interval: float = DEFAULT_INTERVAL,
+        jitter: float = JITTER,
+        max_concurrent: int = MAX_CONCURRENT,
+    ):
+        self.get_rules = get_rules
+        self.evaluate = evaluate
+        self.seen = seen
+        self.store = store
+        self.interval = interval
+        self.jitter = jitter
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="rule-eval")
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._leader = False
+        self._lease_checked = None
+        self._next_run: Dict[int, float] = {}
+        self._running: set = set()
+        self._evaluated: Dict[int, dict] = {}  # rule id -> the rule as it was when it last ran
+
+    # lifecycle
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="rule-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._leader:
+            self._leader = False
+            self.store.release_lease(self.owner)
+
+    @property
+    def is_leader(self) -> bool:
+        return self._leader
+
+    # reading state
+    def state(self, rule_id: int) -> dict | None:
+        """Latest result for a rule: matches, updated_at, error. None if it hasn't run yet."""
+        return self.store.get(rule_id)
+
+    def take_new_items(self, rule_id: int) -> List[Listing]:
+        """New items found since the last call (by any worker), they're handed out once."""
+        return self.store.take_new_items(rule_id)
+
+    # changing the schedule
+    def trigger(self, rule_id: int) -> None:
+        """Run this rule on the next tick (new or edited rule). Another process' scheduler sees it's never run."""
+        with self._lock:
+            self._next_run[rule_id] = 0.0
+        self._wake.set()
+
+    def invalidate(self, rule_id: int) -> None:
+        """Drop stored matches (rule changed) and re-run it soon."""
+        self.store.clear(rule_id)
+        self.trigger(rule_id)
+
+    def offer(self, matches: Dict[int, List[Listing]]) -> None:
+        """
+        Matches for rules found outside their own run (e.g. percolated from another search).
+        Only rules that already ran are updated, new-ness goes through the same seen index.
+        The stored matches are deduped the same way a run's are and capped at MAX_MATCHES.
+        """
+        for rid, items in matches.items():
+            st = self.store.get(rid)
+            if st is None or st["updated_at"] is None:
+                continue
+            try:
+                new_items = self.seen.filter_new(rid, items)
+            except Exception as e:
+                print(f"seen index failed for rule {rid}:", e)
+                continue
+            if not new_items:
+                continue
+            self.store.add_new_items(rid, new_items)
+            try:
+                merged = duplicate_index.dedupe(new_items + st["matches"])[:MAX_MATCHES]
+            except Exception as e:
+                print(f"dedupe failed for rule {rid}:", e)
+                merged = (new_items + st["matches"])[:MAX_MATCHES]
+            # skipped if a run finished meanwhile, that one already has fresher matches
+            self.store.replace_matches(rid, merged, st["version"])
+
+    def run_now(self, rule: dict) -> dict:
+        """Evaluate a rule in the calling thread, e.g. when a page needs it before the first background run."""
+        self._evaluate([rule])
+        return self.state(rule["id"])
+
+    # internals
+    def _check_lease(self) -> bool:
+        now = time.monotonic()
+        if self._lease_checked is not None and now - self._lease_checked < LEASE_RENEW:
+            return self._leader
+        self._lease_checked = now
+        leader = self.store.acquire_lease(self.owner, LEASE_SECONDS)
+        if leader and not self._leader:
+            self._resume()
+        self._leader = leader
+        return leader
+
+    def _resume(self) -> None:
+        """Just became the scheduling process: carry on from the stored runs instead of re-running every rule."""
+        now, wall = time.monotonic(), datetime.utcnow()
+        stored = self.store.states()
+        with self._lock:
+            self._next_run.clear()
+            self._evaluated.clear()
+            for rid, st in stored.items():
+                self._evaluated[rid] = st["rule"]
+                if st["updated_at"] is not None:
+                    age = (wall - st["updated_at"]).total_seconds()
+                    self._next_run[rid] = now + max(0.0, self._next_delay(st["rule"]) - age)
+
+    def _due_groups(self) -> List[List[dict]]:
+        now = time.monotonic()
+        groups: Dict[str, List[dict]] = {}
+        due_keys = set()
+        rules = self.get_rules()
+        with self._lock:
+            for rule in rules:
+                rid = rule["id"]
+                if rid in self._running:
+                    continue
+                key = group_key(rule)
+                groups.setdefault(key, []).append(rule)
+                last = self._evaluated.get(rid)
+                # a rule edited (maybe by another worker process) runs again straight away
+                changed = last is not None and last != rule
+                if changed or self._next_run.get(rid, 0.0) <= now:
+                    due_keys.add(key)
+
+            due = [groups[key] for key in due_keys]
+            for group in due:
+                self._running.update(rule["id"] for rule in group)
+        return due
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                if self._check_lease():
+                    for group in self._due_groups():
+                        self._executor.submit(self._evaluate, group)
+            except Exception as e:
+                print("rule scheduler failed:", e)
+            self._wake.wait(TICK)
+            self._wake.clear()
+
+    def _next_delay(self, rule: dict) -> float:
+        base = rule.get("interval") or self.interval
+        return base * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _evaluate(self, rules: List[dict]) -> None:
+        try:
+            results = self.evaluate(rules)
+            error = None
+        except Exception as e:
+            print(f"watch rules {[r['id'] for r in rules]} failed:", e)
+            results = {}
+            error = str(e)
+
+        for rule in rules:
+            rid = rule["id"]
+            matches = results.get(rid)
+            new_items = []
+            if matches is not None:
+                # new-item diff goes through the persistent seen index
+                try:
+                    new_items = self.seen.filter_new(rid, matches)
+                except Exception as e:
+                    print(f"seen index failed for rule {rid}:", e)
+            try:
+                self.store.save(rule, matches, new_items, error)
+            except Exception as e:
+                print(f"saving watch rule {rid} failed:", e)
+            with self._lock:
+                self._running.discard(rid)
+                self._next_run[rid] = time.monotonic() + self._next_delay(rule)
+                self._evaluated[rid] = dict(rule)